@@ -0,0 +1,136 @@
+"""On-disk Opus copies of frequently played tracks, capped in size and evicted least recently played first."""
+import asyncio
+import os
+import re
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from deps import MissingDependency, lazy_import
+
+yt_dlp = lazy_import('yt_dlp', 'yt-dlp', 'music playback')
+
+SAFE_NAME = re.compile(r'[^A-Za-z0-9_-]')
+
+
+def cache_key(video_id):
+    return SAFE_NAME.sub('_', video_id)
+
+
+def download_opus(url, path_base):
+    """Blocking: downloads the audio and converts it to an Opus file at path_base + '.opus'."""
+    options = {
+        'format': 'bestaudio[acodec=opus]/bestaudio/best',
+        'noplaylist': True,
+        'quiet': True,
+        'outtmpl': path_base + '.%(ext)s',
+        'postprocessors': [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'opus'}],
+    }
+    with yt_dlp.YoutubeDL(options) as ydl:
+        ydl.download([url])
+    return path_base + '.opus'
+
+
+class AudioCache:
+    def __init__(self, directory, max_bytes, min_plays, workers=1):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_plays = min_plays  # Plays before a track is worth downloading
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="audio-cache")
+        self.files = OrderedDict()  # cache key -> size in bytes, least recently played first
+        self.total_bytes = 0
+        self.play_counts = Counter()
+        self.downloading = set()
+        self.tasks = set()  # Running download tasks, kept so they aren't garbage collected and can be cancelled
+        self.scan()
+
+    def scan(self):
+        """Indexes the files already on disk, oldest access first, and clears out unfinished downloads."""
+        entries = []
+        with os.scandir(self.directory) as scanner:
+            for entry in scanner:
+                if not entry.is_file():
+                    continue
+                if entry.name.startswith('.tmp-'):
+                    os.remove(entry.path)
+                elif entry.name.endswith('.opus'):
+                    stat = entry.stat()
+                    entries.append((stat.st_atime, entry.name[:-len('.opus')], stat.st_size))
+        for _, key, size in sorted(entries):
+            self.files[key] = size
+            self.total_bytes += size
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key + '.opus')
+
+    def lookup(self, video_id):
+        """Returns the cached file for the track, or None, and marks it as recently played."""
+        key = cache_key(video_id)
+        if key not in self.files:
+            return None
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            self.total_bytes -= self.files.pop(key)
+            return None
+        self.files.move_to_end(key)
+        now = time.time()
+        os.utime(path, (now, now))  # Keeps the order across restarts
+        return path
+
+    def record_play(self, track):
+        """Counts a play and returns True if the track should be downloaded now."""
+        key = cache_key(track.video_id)
+        self.play_counts[key] += 1
+        return (self.max_bytes > 0 and key not in self.files and key not in self.downloading
+                and self.play_counts[key] >= self.min_plays and bool(track.duration))
+
+    def start_download(self, track):
+        """Starts downloading the track in the background."""
+        task = asyncio.create_task(self.download(track))
+        self.tasks.add(task)
+        task.add_done_callback(self.download_done)
+        return task
+
+    def download_done(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            error = task.exception()
+            print(f"Caching a track failed unexpectedly: {type(error).__name__}: {error}")
+
+    async def download(self, track):
+        """Downloads the track in the background pool and adds it to the cache."""
+        key = cache_key(track.video_id)
+        self.downloading.add(key)
+        path_base = os.path.join(self.directory, f'.tmp-{key}')
+        try:
+            loop = asyncio.get_running_loop()
+            downloaded = await loop.run_in_executor(self.pool, download_opus, track.webpage_url, path_base)
+            path = self.path_for(key)
+            os.replace(downloaded, path)
+        except MissingDependency as error:  # Before DownloadError, which needs yt_dlp to name
+            print(f"Couldn't cache {track.title}: {error}")
+            return
+        except (yt_dlp.utils.DownloadError, OSError) as error:
+            print(f"Couldn't cache {track.title}: {error}")
+            return
+        finally:
+            self.downloading.discard(key)
+
+        size = os.path.getsize(path)
+        self.files[key] = size
+        self.total_bytes += size
+        self.evict()
+
+    def evict(self):
+        while self.total_bytes > self.max_bytes and self.files:
+            key, size = self.files.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(self.path_for(key))
+            except OSError:
+                pass
+
+    def shutdown(self):
+        for task in self.tasks:
+            task.cancel()
+        self.pool.shutdown(wait=False, cancel_futures=True)
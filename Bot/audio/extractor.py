@@ -0,0 +1,73 @@
+"""Runs yt-dlp off the event loop with per-guild limits, timeouts and cancellation."""
+import asyncio
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from deps import MissingDependency, lazy_import
+
+yt_dlp = lazy_import('yt_dlp', 'yt-dlp', 'music playback')
+
+
+class ExtractionError(Exception):
+    pass
+
+
+class ExtractionCancelled(ExtractionError):
+    pass
+
+
+def extract_info(query, options):
+    """Blocking yt-dlp call, run inside the worker pool."""
+    with yt_dlp.YoutubeDL(options) as ydl:
+        return ydl.extract_info(query, download=False)
+
+
+class Extractor:
+    def __init__(self, max_workers, per_guild, timeout):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="yt-dlp")
+        self.per_guild = per_guild
+        self.timeout = timeout
+        self.guild_limits = {}  # guild_id -> asyncio.Semaphore
+        self.pending = defaultdict(set)  # (guild_id, requester_id) -> running extraction tasks
+
+    async def extract(self, query, options, guild_id, requester_id=None):
+        """Returns yt-dlp's info dict for the query, raising ExtractionError if it fails, times out or is cancelled."""
+        task = asyncio.get_running_loop().create_task(self.run(query, options, guild_id))
+        key = (guild_id, requester_id)
+        self.pending[key].add(task)
+        try:
+            await asyncio.wait({task})
+        finally:
+            self.pending[key].discard(task)
+            if not self.pending[key]:
+                del self.pending[key]
+            if not task.done():
+                task.cancel()  # Whoever was waiting went away
+
+        if task.cancelled():
+            raise ExtractionCancelled("The request was cancelled.")
+        return task.result()
+
+    async def run(self, query, options, guild_id):
+        limit = self.guild_limits.get(guild_id)
+        if limit is None:
+            limit = self.guild_limits[guild_id] = asyncio.Semaphore(self.per_guild)
+
+        async with limit:
+            loop = asyncio.get_running_loop()
+            try:
+                return await asyncio.wait_for(loop.run_in_executor(self.pool, extract_info, query, options), self.timeout)
+            except asyncio.TimeoutError:
+                raise ExtractionError(f"Looking up '{query}' took too long.") from None
+            except MissingDependency as error:  # Before DownloadError, which needs yt_dlp to name
+                raise ExtractionError(str(error)) from None
+            except yt_dlp.utils.DownloadError as error:
+                raise ExtractionError(f"Couldn't load '{query}': {error}") from None
+
+    def cancel_requester(self, guild_id, requester_id):
+        """Cancels every extraction started for someone, e.g. because they left the voice channel."""
+        for task in list(self.pending.get((guild_id, requester_id), ())):
+            task.cancel()
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
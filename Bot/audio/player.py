@@ -0,0 +1,135 @@
+"""Per-guild playback state: the queue, history and loop mode."""
+import itertools
+import random
+import time
+from collections import deque
+
+LOOP_MODES = ('off', 'queue', 'single')
+
+
+class GuildPlayer:
+    def __init__(self, guild_id, history_size=50):
+        self.guild_id = guild_id
+        self.queue = deque()  # Upcoming tracks
+        self.history = deque(maxlen=history_size)  # Finished tracks, most recent last
+        self.current = None
+        self.loop_mode = 'off'
+        self.skip_requested = False  # Set by !skip so a looped song still moves on
+        self.seek_to = None  # Set to restart the current track at this many seconds instead of moving on
+        self.volume = 1.0
+        self.text_channel = None  # Where now-playing messages are sent
+        self.now_playing = None  # The now-playing message, edited for each new track
+        self.started_at = None  # time.monotonic() when the current track started, moved on by any time spent paused
+        self.paused_at = None  # time.monotonic() when playback was paused, or None while it plays
+        self.prefetch_task = None  # Background task resolving the upcoming tracks
+        self.prepared_track = None  # Next track whose audio source is already started
+        self.prepared_source = None
+
+    def __len__(self):
+        return len(self.queue)
+
+    def enqueue(self, track):
+        self.queue.append(track)
+
+    def enqueue_many(self, tracks):
+        self.queue.extend(tracks)
+
+    def advance(self):
+        """Moves on from the current track, honouring the loop mode, and returns the track to play next (or None)."""
+        if self.seek_to is not None and self.current is not None:
+            return self.current
+        skipping, self.skip_requested = self.skip_requested, False
+        finished = self.current
+        if finished is not None:
+            if self.loop_mode == 'single' and not skipping:
+                return finished
+            self.history.append(finished)
+            if self.loop_mode == 'queue':
+                self.queue.append(finished)
+
+        self.current = self.queue.popleft() if self.queue else None
+        return self.current
+
+    def upcoming(self, count):
+        """The next `count` tracks that will play, taking the loop mode into account."""
+        if self.loop_mode == 'single' and self.current is not None:
+            return [self.current]
+        tracks = list(itertools.islice(self.queue, count))
+        if self.loop_mode == 'queue' and self.current is not None and len(tracks) < count:
+            tracks.append(self.current)
+        return tracks
+
+    def position(self):
+        """Seconds played of the current track, or 0 if nothing is playing."""
+        if self.current is None or self.started_at is None:
+            return 0.0
+        now = self.paused_at if self.paused_at is not None else time.monotonic()
+        return now - self.started_at
+
+    def start_clock(self, position=0.0):
+        """Starts timing the current track as if it had already played `position` seconds."""
+        self.started_at = time.monotonic() - position
+        self.paused_at = None
+
+    def pause_clock(self):
+        if self.paused_at is None:
+            self.paused_at = time.monotonic()
+
+    def resume_clock(self):
+        if self.paused_at is not None:
+            if self.started_at is not None:
+                self.started_at += time.monotonic() - self.paused_at
+            self.paused_at = None
+
+    def remaining(self):
+        """Seconds left in the current track, or None if unknown."""
+        if self.current is None or not self.current.duration or self.started_at is None:
+            return None
+        return max(0.0, self.current.duration - self.position())
+
+    def prepare(self, track, source):
+        """Keeps an already started audio source for the track expected to play next."""
+        self.discard_prepared()
+        self.prepared_track, self.prepared_source = track, source
+
+    def take_prepared(self, track):
+        """Returns the prepared source if it was made for this track, discarding it otherwise."""
+        if self.prepared_track is track:
+            source = self.prepared_source
+            self.prepared_track = self.prepared_source = None
+            return source
+        self.discard_prepared()
+        return None
+
+    def discard_prepared(self):
+        if self.prepared_source is not None:
+            self.prepared_source.cleanup()
+        self.prepared_track = self.prepared_source = None
+
+    def close(self):
+        """Stops background work and releases the prepared source when the player is torn down."""
+        if self.prefetch_task is not None:
+            self.prefetch_task.cancel()
+            self.prefetch_task = None
+        self.discard_prepared()
+
+    def shuffle(self):
+        items = list(self.queue)
+        random.shuffle(items)
+        self.queue = deque(items)
+
+    def remove(self, index):
+        """Removes and returns the track at a 0-based queue position."""
+        track = self.queue[index]
+        del self.queue[index]
+        return track
+
+    def move(self, source, destination):
+        """Moves the track at one 0-based queue position to another."""
+        track = self.remove(source)
+        self.queue.insert(destination, track)
+        return track
+
+    def clear(self):
+        self.queue.clear()
+        self.current = None
@@ -0,0 +1,126 @@
+"""Saved playlists per guild, stored in one SQLite file under ./data/playlists."""
+import sqlite3
+import threading
+import time
+
+from audio.tracks import Track
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS playlists (
+    id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    name TEXT NOT NULL COLLATE NOCASE,
+    owner_id INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    UNIQUE (guild_id, name)
+);
+CREATE TABLE IF NOT EXISTS playlist_tracks (
+    playlist_id INTEGER NOT NULL REFERENCES playlists (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    video_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    webpage_url TEXT NOT NULL,
+    duration INTEGER,
+    PRIMARY KEY (playlist_id, position)
+) WITHOUT ROWID;
+"""
+
+
+class PlaylistError(Exception):
+    pass
+
+
+class PlaylistStore:
+    """Every method is blocking, so the cog calls them from an executor."""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def playlist_id(self, guild_id, name):
+        row = self.db.execute("SELECT id FROM playlists WHERE guild_id = ? AND name = ?", (guild_id, name)).fetchone()
+        if row is None:
+            raise PlaylistError(f"There is no playlist called '{name}'.")
+        return row[0]
+
+    def create(self, guild_id, name, owner_id):
+        with self.lock, self.db:
+            try:
+                self.db.execute(
+                    "INSERT INTO playlists (guild_id, name, owner_id, created_at) VALUES (?, ?, ?, ?)",
+                    (guild_id, name, owner_id, time.time()),
+                )
+            except sqlite3.IntegrityError:
+                raise PlaylistError(f"A playlist called '{name}' already exists.") from None
+
+    def delete(self, guild_id, name):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM playlists WHERE id = ?", (self.playlist_id(guild_id, name),))
+
+    def add(self, guild_id, name, tracks):
+        """Appends tracks to the end of a playlist and returns its new length."""
+        with self.lock, self.db:
+            playlist_id = self.playlist_id(guild_id, name)
+            start = self.db.execute(
+                "SELECT COALESCE(MAX(position) + 1, 0) FROM playlist_tracks WHERE playlist_id = ?", (playlist_id,)
+            ).fetchone()[0]
+            self.db.executemany(
+                "INSERT INTO playlist_tracks VALUES (?, ?, ?, ?, ?, ?)",
+                [(playlist_id, start + i, track.video_id, track.title, track.webpage_url, track.duration)
+                 for i, track in enumerate(tracks)],
+            )
+            return start + len(tracks)
+
+    def load(self, guild_id, name):
+        """Returns the playlist as unresolved Tracks; stream URLs are looked up when each one nears playback."""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT video_id, title, webpage_url, duration FROM playlist_tracks WHERE playlist_id = ? ORDER BY position",
+                (self.playlist_id(guild_id, name),),
+            ).fetchall()
+        return [Track(video_id, title, webpage_url, duration=duration) for video_id, title, webpage_url, duration in rows]
+
+    def list(self, guild_id):
+        """(name, track count) for every playlist in the guild."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT p.name, COUNT(t.position) FROM playlists p LEFT JOIN playlist_tracks t ON t.playlist_id = p.id "
+                "WHERE p.guild_id = ? GROUP BY p.id ORDER BY p.name",
+                (guild_id,),
+            ).fetchall()
+
+    def export(self, guild_id, name):
+        """The playlist as plain data, for sharing as a JSON file."""
+        tracks = self.load(guild_id, name)
+        return {
+            "name": name,
+            "tracks": [
+                {"id": track.video_id, "title": track.title, "url": track.webpage_url, "duration": track.duration}
+                for track in tracks
+            ],
+        }
+
+    def import_(self, guild_id, name, owner_id, data):
+        """Creates a playlist from exported data; entries may also be plain search strings."""
+        entries = data.get("tracks") if isinstance(data, dict) else data
+        if not isinstance(entries, list):
+            raise PlaylistError("That file doesn't contain a list of tracks.")
+
+        tracks = []
+        for entry in entries:
+            if isinstance(entry, str):
+                tracks.append(Track.from_search(entry))
+            elif isinstance(entry, dict) and entry.get("url"):
+                tracks.append(Track(entry.get("id") or entry["url"], entry.get("title") or entry["url"], entry["url"],
+                                    duration=entry.get("duration")))
+        if not tracks:
+            raise PlaylistError("That file doesn't contain any tracks.")
+
+        self.create(guild_id, name, owner_id)
+        return self.add(guild_id, name, tracks)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
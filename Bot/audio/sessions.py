@@ -0,0 +1,52 @@
+"""Bookkeeping for the bot's voice connections: when each started, when it was last used and how it has fared."""
+import time
+
+
+class VoiceSession:
+    __slots__ = ('guild_id', 'channel_id', 'connected_at', 'last_active', 'tracks_played', 'reconnects', 'leaving')
+
+    def __init__(self, guild_id, channel_id):
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.connected_at = time.monotonic()
+        self.last_active = self.connected_at  # Last time something was playing to someone
+        self.tracks_played = 0
+        self.reconnects = 0
+        self.leaving = False  # Set before a disconnect we asked for, so it isn't treated as a dropped connection
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def idle_for(self):
+        return time.monotonic() - self.last_active
+
+    def connected_for(self):
+        return time.monotonic() - self.connected_at
+
+
+class VoiceSessions:
+    def __init__(self, idle_timeout):
+        self.idle_timeout = idle_timeout  # Seconds without playback before the bot leaves
+        self.sessions = {}  # guild_id -> VoiceSession
+        self.total_reconnects = 0
+
+    def start(self, guild_id, channel_id):
+        session = self.sessions[guild_id] = VoiceSession(guild_id, channel_id)
+        return session
+
+    def get(self, guild_id):
+        return self.sessions.get(guild_id)
+
+    def end(self, guild_id):
+        return self.sessions.pop(guild_id, None)
+
+    def record_reconnect(self, session):
+        session.reconnects += 1
+        self.total_reconnects += 1
+
+    def idle(self):
+        """Sessions that have gone longer than the idle timeout without playing anything."""
+        if self.idle_timeout <= 0:
+            return []
+        return [session for session in self.sessions.values()
+                if not session.leaving and session.idle_for() > self.idle_timeout]
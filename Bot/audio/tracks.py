@@ -0,0 +1,153 @@
+"""Track metadata and a TTL + LRU cache of it, so each video is only extracted once."""
+import re
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_THUMBNAIL = 'https://example.com/default_thumbnail.jpg'
+
+
+def stream_expiry(url, default_ttl):
+    """Reads the expiry timestamp that YouTube stream URLs carry, falling back to a fixed lifetime."""
+    expire = parse_qs(urlparse(url).query).get('expire')
+    if expire and expire[0].isdigit():
+        return float(expire[0])
+    return time.time() + default_ttl
+
+
+def thumbnail_url(info):
+    thumbnail = info.get('thumbnail')
+    if not thumbnail or not re.match(r'^https?://', thumbnail):
+        return DEFAULT_THUMBNAIL
+    return thumbnail
+
+
+def known_codec(acodec):
+    # yt-dlp reports 'none' or nothing when it doesn't know the codec
+    return acodec if acodec and acodec != 'none' else None
+
+
+class Track:
+    __slots__ = ('video_id', 'title', 'webpage_url', 'thumbnail', 'duration', 'stream_url', 'expires_at', 'acodec')
+
+    def __init__(self, video_id, title, webpage_url, thumbnail=None, duration=None, stream_url=None, expires_at=0,
+                 acodec=None):
+        self.video_id = video_id
+        self.title = title
+        self.webpage_url = webpage_url  # Stable page URL, used to get a fresh stream URL
+        self.thumbnail = thumbnail
+        self.duration = duration  # Seconds, or None for live streams
+        self.stream_url = stream_url
+        self.expires_at = expires_at  # When stream_url stops working (Unix time)
+        self.acodec = acodec  # Audio codec of stream_url, e.g. 'opus'; None until known
+
+    @classmethod
+    def from_info(cls, info, stream_ttl):
+        """Builds a track from a fully extracted yt-dlp entry."""
+        stream_url = info.get('url')
+        return cls(
+            info.get('id') or info.get('webpage_url'), info.get('title', 'Unknown title'),
+            info.get('webpage_url') or info.get('original_url') or stream_url, thumbnail_url(info), info.get('duration'),
+            stream_url, stream_expiry(stream_url, stream_ttl) if stream_url else 0, known_codec(info.get('acodec')),
+        )
+
+    @classmethod
+    def from_flat(cls, entry):
+        """Builds an unresolved track from a flat (metadata only) playlist entry."""
+        url = entry.get('webpage_url') or entry['url']
+        return cls(entry.get('id') or url, entry.get('title') or url, url, duration=entry.get('duration'))
+
+    @classmethod
+    def from_search(cls, query):
+        """An unresolved track that becomes the first search result once its stream is looked up."""
+        return cls(f'search:{query}', query, f'ytsearch1:{query}')
+
+    @classmethod
+    def from_link(cls, url):
+        """An unresolved track for a link whose video isn't known yet."""
+        return cls(f'link:{url}', url, url)
+
+    @property
+    def is_search(self):
+        return self.webpage_url.startswith('ytsearch')
+
+    @property
+    def is_placeholder(self):
+        """True for searches and links that haven't been looked up yet."""
+        return self.video_id.startswith(('search:', 'link:'))
+
+    def update_stream(self, info, stream_ttl):
+        if self.is_placeholder:
+            # Now that the lookup has found a video, this track is that video
+            self.video_id = info.get('id') or self.video_id
+            self.title = info.get('title', self.title)
+            self.webpage_url = info.get('webpage_url') or self.webpage_url
+        self.stream_url = info['url']
+        self.expires_at = stream_expiry(self.stream_url, stream_ttl)
+        self.acodec = known_codec(info.get('acodec'))  # A new URL may point at a different format
+        # Unresolved tracks (from playlists or searches) may not have these yet
+        if self.thumbnail is None:
+            self.thumbnail = thumbnail_url(info)
+        if self.duration is None:
+            self.duration = info.get('duration')
+
+    def stream_expired(self, margin=60):
+        """True if the stream URL is missing or will expire within `margin` seconds."""
+        return self.stream_url is None or time.time() + margin >= self.expires_at
+
+    @property
+    def duration_text(self):
+        if not self.duration:
+            return 'live'
+        minutes, seconds = divmod(int(self.duration), 60)
+        hours, minutes = divmod(minutes, 60)
+        return f'{hours}:{minutes:02}:{seconds:02}' if hours else f'{minutes}:{seconds:02}'
+
+
+class TrackCache:
+    """Tracks by video id, plus which video each search query found, both evicted by age and least recent use."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl  # Seconds a cached track's metadata is trusted
+        self.tracks = OrderedDict()  # video_id -> (cached at, Track)
+        self.queries = OrderedDict()  # normalized search -> video_id
+
+    @staticmethod
+    def normalize(query):
+        return ' '.join(query.lower().split())
+
+    def get(self, video_id):
+        cached = self.tracks.get(video_id)
+        if cached is None:
+            return None
+        if time.monotonic() - cached[0] > self.ttl:
+            del self.tracks[video_id]
+            return None
+        self.tracks.move_to_end(video_id)
+        return cached[1]
+
+    def get_query(self, query):
+        """The cached track a search previously found, or None."""
+        key = self.normalize(query)
+        video_id = self.queries.get(key)
+        if video_id is None:
+            return None
+        track = self.get(video_id)
+        if track is None:
+            del self.queries[key]
+            return None
+        self.queries.move_to_end(key)
+        return track
+
+    def put(self, track, query=None):
+        self.tracks[track.video_id] = (time.monotonic(), track)
+        self.tracks.move_to_end(track.video_id)
+        if len(self.tracks) > self.max_size:
+            self.tracks.popitem(last=False)
+        if query is not None:
+            key = self.normalize(query)
+            self.queries[key] = track.video_id
+            self.queries.move_to_end(key)
+            if len(self.queries) > self.max_size:
+                self.queries.popitem(last=False)
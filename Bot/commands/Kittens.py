@@ -1,108 +1,31 @@
 import discord
 from discord.ext import commands
 from discord.ui import Button, View
-import random
 import asyncio
+import typing
 
-
-class Card:
-    def __init__(self, name, effect):
-        self.name = name
-        self.effect = effect  # The type of effect this card has (e.g., 'defuse', 'explode', 'cat', etc.)
-
-    def __repr__(self):
-        return f"Card(name={self.name}, effect={self.effect})"
-
-
-class ExplodingKittensGame:
-    def __init__(self, players, starting_hand_size=5, defuse_count=6, bomb_count=1, attack_x2_count=2,
-                 attack_x3_count=2, skip_count=2, nope_count=2, future_count=2, reveal_future_count=1):
-        self.players = players  # List of player IDs
-        self.deck = self.create_deck(len(players), defuse_count, bomb_count, attack_x2_count, attack_x3_count,
-                                     skip_count, nope_count, future_count, reveal_future_count)
-        self.hands = {player: [] for player in players}
-        self.turn_index = 0
-        self.starting_hand_size = starting_hand_size
-        self.init_hands()
-
-    def create_deck(self, num_players, defuse_count, bomb_count, attack_x2_count, attack_x3_count, skip_count,
-                    nope_count, future_count, reveal_future_count):
-        # Create a deck with Exploding Kittens, Defuse, and other special cards
-        deck = [Card("Exploding Kitten", "explode")] * bomb_count
-        deck += [Card("Defuse", "defuse")] * defuse_count
-        deck += [Card("Attack x2", "attack2")] * attack_x2_count
-        deck += [Card("Attack x3", "attack3")] * attack_x3_count
-        deck += [Card("Skip", "skip")] * skip_count
-        deck += [Card("Nope", "nope")] * nope_count
-        deck += [Card("See the Future", "future")] * future_count
-        deck += [Card("Reveal the Future", "reveal_future")] * reveal_future_count
-        # Adding the 5 unique Cat cards
-        cat_names = ["Palindrome Cat", "Beard Cat", "Smol Cat", "Big Cat", "Panzer Cat"]
-        for name in cat_names:
-            deck += [Card(name, "cat")] * 2  # Two of each Cat card
-        random.shuffle(deck)
-        return deck
-
-    def init_hands(self):
-        # Deal initial hands to each player
-        for player in self.players:
-            self.hands[player] = [self.deck.pop() for _ in range(self.starting_hand_size)]
-            # Add a defuse card to each player's hand
-            self.hands[player].append(Card("Defuse", "defuse"))
-
-    def draw_card(self, player_id):
-        # Player draws a card from the deck
-        card = self.deck.pop()
-        if card.name == "Exploding Kitten":
-            # Handle explosion or defuse
-            return self.handle_explosion(player_id)
-        else:
-            self.hands[player_id].append(card)
-            return f"{player_id} drew a {card.name} card."
-
-    def handle_explosion(self, player_id):
-        # Check if player has a defuse card
-        hand = self.hands[player_id]
-        defuse_card = next((c for c in hand if c.name == "Defuse"), None)
-        if defuse_card:
-            # Use Defuse card
-            hand.remove(defuse_card)
-            # Place Exploding Kitten back in the deck at random position
-            self.deck.insert(random.randint(0, len(self.deck)), Card("Exploding Kitten", "explode"))
-            return f"{player_id} used a Defuse card to avoid the explosion!"
-        else:
-            # Player is eliminated
-            self.players.remove(player_id)
-            return f"{player_id} has exploded and is out of the game!"
-
-    def steal_card(self, player_id, target_id):
-        # Check if player has two of the same Cat card
-        hand = self.hands[player_id]
-        cat_cards = [card for card in hand if card.effect == "cat"]
-        card_count = {card.name: cat_cards.count(card) for card in cat_cards}
-        stealable_cat = [card for card, count in card_count.items() if count >= 2]
-
-        if stealable_cat:
-            selected_cat = random.choice(stealable_cat)
-            # Steal a random card from the target player
-            target_hand = self.hands[target_id]
-            stolen_card = random.choice(target_hand)
-            self.hands[target_id].remove(stolen_card)
-            self.hands[player_id].append(stolen_card)
-            return f"{player_id} stole a {stolen_card.name} card from {target_id} using {selected_cat}!"
-        else:
-            return f"{player_id} does not have two of the same Cat card to steal."
-
-    def next_turn(self):
-        # Advance to the next player
-        self.turn_index = (self.turn_index + 1) % len(self.players)
-        return f"It is now {self.players[self.turn_index]}'s turn."
+import config
+from games.kittens import CardType, ExplodingKittensGame, Phase, RulesError, parse_card
+from games.router import make_custom_id, router
 
 
 class ExplodingKittens(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.active_games = {}  # Stores active games with channel ID as key
+        self.nope_windows = {}  # channel ID -> task that resolves the pending card once nobody Nopes in time
+        self.hand_messages = {}  # channel ID -> {player ID: (hand DM, what it showed)}
+        self.hand_locks = {}  # channel ID -> lock, so one hand update per channel runs at a time
+
+    async def cog_load(self):
+        # Hand buttons carry the game's channel id, so they work from DMs, after restarts and after views time out
+        router.attach(self.bot)
+        router.register("kittens", self.press_button)
+
+    async def cog_unload(self):
+        router.unregister("kittens")
+        for task in self.nope_windows.values():
+            task.cancel()
 
     @commands.command(name="start_game")
     async def start_game(self, ctx, starting_hand_size: int = 5, defuse_count: int = 6, bomb_count: int = 1,
@@ -118,66 +41,212 @@ class ExplodingKittens(commands.Cog):
         self.active_games[ctx.channel.id] = game
         await ctx.send("Exploding Kittens game started! Players have been dealt their hands.")
 
-        # Display starting hands to each player with buttons
-        for player_id in player_ids:
-            player = self.bot.get_user(player_id)
-            await self.display_player_deck(player, game)
+        # Display starting hands to each player with buttons, all at once
+        await self.update_hands(ctx.channel.id, game)
 
         await ctx.send(f"{self.bot.get_user(game.players[0]).mention} goes first!")
 
-    async def display_player_deck(self, player, game):
-        hand = game.hands[player.id]
-        hand_buttons = []
-
-        # Create buttons for each card the player has, if it's their turn
-        for card in hand:
-            if card.name != "Nope":  # NOPE should be handled separately
-                button = Button(label=card.name, custom_id=f"card_{card.name}", style=discord.ButtonStyle.primary)
-                hand_buttons.append(button)
+    def render_hand(self, channel_id, player_id, game, previous=None):
+        """The embed and buttons for a player's hand, noting what changed since `previous` (per-type counts)."""
+        hand = game.hands[player_id]
+        my_turn = player_id == game.current_player and game.phase == Phase.TURN
+        view = View(timeout=None)
+
+        # One button per card type the player has; only the turn's player can use them, except Nope
+        for card, count in hand.cards():
+            label = f"{card.label} x{count}" if count > 1 else card.label
+            if card != CardType.NOPE:
+                view.add_item(Button(label=label, custom_id=make_custom_id("kittens", channel_id, card.name.lower()),
+                                     style=discord.ButtonStyle.primary, disabled=not my_turn))
             else:
-                # NOPE button is available for everyone to prevent steal
-                button = Button(label="NOPE", custom_id="card_nope", style=discord.ButtonStyle.danger)
-                hand_buttons.append(button)
+                # NOPE button is available for everyone to cancel the card just played
+                view.add_item(Button(label=f"NOPE x{count}" if count > 1 else "NOPE",
+                                     custom_id=make_custom_id("kittens", channel_id, "nope"),
+                                     style=discord.ButtonStyle.danger))
+        view.add_item(Button(label="Draw", custom_id=make_custom_id("kittens", channel_id, "draw"),
+                             style=discord.ButtonStyle.success, disabled=not my_turn))
+        view.stop()  # Presses go through the shared router, so discord.py doesn't need to keep this View
+
+        description = "\n".join(f"{card.label} x{count}" for card, count in hand.cards()) or "No cards"
+        if previous is not None:
+            changes = [f"{'+' if now > before else '-'}{abs(now - before)} {CardType(card).label}"
+                       for card, (before, now) in enumerate(zip(previous, hand.counts)) if now != before]
+            if changes:
+                description += f"\n\nSince last update: {', '.join(changes)}"
+        title = "Your Hand (your turn!)" if player_id == game.current_player else "Your Hand"
+        return discord.Embed(title=title, description=description, color=discord.Color.green()), view
+
+    async def update_hands(self, channel_id, game):
+        """Brings every player's hand DM up to date, editing the existing messages and skipping unchanged hands.
+
+        Updates for a channel run one after another: each reads the stored messages and the game as they are when it
+        starts, so an older hand can't overwrite a newer one and nobody gets a second new DM.
+        """
+        async with self.hand_locks.setdefault(channel_id, asyncio.Lock()):
+            await self.send_hands(channel_id, game)
+
+    async def send_hands(self, channel_id, game):
+        messages = self.hand_messages.setdefault(channel_id, {})
+        limit = asyncio.Semaphore(config.KITTENS_DM_CONCURRENCY)  # Keeps a burst of DMs under the rate limits
+
+        async def update(player_id):
+            snapshot = (bytes(game.hands[player_id].counts), player_id == game.current_player and game.phase == Phase.TURN)
+            message, previous = messages.get(player_id, (None, None))
+            if previous == snapshot:
+                return  # Nothing this player can see has changed
+            embed, view = self.render_hand(channel_id, player_id, game, previous[0] if previous else None)
+            async with limit:
+                try:
+                    if message is not None:
+                        try:
+                            await message.edit(embed=embed, view=view)
+                        except discord.NotFound:
+                            message = None  # Deleted, so send a new one
+                    if message is None:
+                        user = self.bot.get_user(player_id) or await self.bot.fetch_user(player_id)
+                        message = await user.send(embed=embed, view=view)
+                except discord.HTTPException as error:
+                    print(f"Couldn't update the hand of {player_id}: {error}")  # E.g. they don't accept DMs
+                    return
+            messages[player_id] = (message, snapshot)
+
+        await asyncio.gather(*(update(player_id) for player_id in game.seats))
+
+    def get_game(self, ctx):
+        return self.active_games.get(ctx.channel.id)
+
+    async def act(self, channel, player_id, action, *args):
+        """Applies a game action in the channel's game, announces it and updates hands; returns an error or None."""
+        game = self.active_games.get(channel.id)
+        if game is None:
+            return "No active game in this channel. Start one with !start_game."
+        try:
+            message = action(game, player_id, *args)
+        except RulesError as error:
+            return str(error)
+        await channel.send(message)
+
+        if action in (ExplodingKittensGame.play, ExplodingKittensGame.nope):
+            self.start_nope_window(channel)  # Everyone gets a fresh chance to Nope
+        elif action == ExplodingKittensGame.draw:
+            if game.phase == Phase.DEFUSE:
+                await channel.send(f"<@{player_id}>, choose where the kitten goes with !ek_defuse <position> "
+                                   f"(0 puts it on top, {len(game.deck)} at the bottom).")
+            elif await self.finish_if_over(channel, game):
+                return None
+        # The turn moving on changes whose buttons are enabled, so every hand is checked
+        await self.update_hands(channel.id, game)
+        return None
+
+    async def press_button(self, interaction, game_id, action):
+        """Handles a hand button routed here by its custom_id ("kittens:<channel id>:<card or action>")."""
+        # Announcing the action and updating every hand can take longer than Discord waits for a response
+        await interaction.response.defer()
+        channel = self.bot.get_channel(int(game_id)) if game_id.isdigit() else None
+        if channel is None or channel.id not in self.active_games:
+            await interaction.followup.send("This game is no longer running.", ephemeral=True)
+            return
 
-        view = View(timeout=10)  # 10 seconds for response
-        for button in hand_buttons:
-            if player.id != game.players[game.turn_index]:  # If it's not the player's turn, disable the button
-                button.disabled = True
-            view.add_item(button)
+        if action == "draw":
+            error = await self.act(channel, interaction.user.id, ExplodingKittensGame.draw)
+        elif action == "nope":
+            error = await self.act(channel, interaction.user.id, ExplodingKittensGame.nope)
+        else:
+            card = CardType.__members__.get(action.upper())
+            if card is None:
+                return
+            if card.is_cat:
+                error = f"Use !ek_play @target {card.label} in {channel.mention} to pick who to steal from."
+            else:
+                error = await self.act(channel, interaction.user.id, ExplodingKittensGame.play, card, None)
+        await interaction.followup.send(error or f"Done! See {channel.mention}.", ephemeral=True)
+
+    @commands.command(name="ek_play")
+    async def play_card(self, ctx, target: typing.Optional[discord.Member] = None, *, card: str = None):
+        """Plays a card, e.g. !ek_play skip, or !ek_play @someone smol cat to steal with a pair"""
+        parsed = parse_card(card or "")
+        if parsed is None:
+            await ctx.send("Usage: !ek_play [@target] <card name>, e.g. !ek_play attack x2")
+            return
+        error = await self.act(ctx.channel, ctx.author.id, ExplodingKittensGame.play, parsed, target.id if target else None)
+        if error:
+            await ctx.send(error)
+
+    @commands.command(name="ek_nope")
+    async def nope(self, ctx):
+        """Nopes the card that was just played (or the last Nope)"""
+        error = await self.act(ctx.channel, ctx.author.id, ExplodingKittensGame.nope)
+        if error:
+            await ctx.send(error)
+
+    def start_nope_window(self, channel):
+        task = self.nope_windows.get(channel.id)
+        if task is not None:
+            task.cancel()
+        self.nope_windows[channel.id] = asyncio.create_task(self.close_nope_window(channel))
+
+    async def close_nope_window(self, channel):
+        await asyncio.sleep(config.KITTENS_NOPE_WINDOW)
+        del self.nope_windows[channel.id]
+        game = self.active_games.get(channel.id)
+        if game is None or game.phase != Phase.REACTION:
+            return
 
-        # Send the embed with their deck and buttons
-        embed = discord.Embed(title="Your Hand", description="\n".join([card.name for card in hand]),
-                              color=discord.Color.green())
-        await player.send(embed=embed, view=view)
+        await channel.send(game.resolve())
+        if game.last_peek is not None:
+            player_id, cards = game.last_peek
+            game.last_peek = None
+            try:
+                user = self.bot.get_user(player_id) or await self.bot.fetch_user(player_id)
+                await user.send(f"The next cards are: {', '.join(c.label for c in cards) or 'none'}.")
+            except discord.HTTPException as error:
+                print(f"Couldn't show the future to {player_id}: {error}")  # E.g. they don't accept DMs
+        await self.update_hands(channel.id, game)
 
     @commands.command(name="ek_draw")
     async def draw_card(self, ctx):
-        channel_id = ctx.channel.id
-        if channel_id not in self.active_games:
-            await ctx.send("No active game in this channel. Start one with !ek start_game.")
-            return
-
-        game = self.active_games[channel_id]
-        player_id = ctx.author.id
-        if game.players[game.turn_index] != player_id:
-            await ctx.send("It's not your turn!")
+        """Draws a card to end your turn"""
+        error = await self.act(ctx.channel, ctx.author.id, ExplodingKittensGame.draw)
+        if error:
+            await ctx.send(error)
+
+    @commands.command(name="ek_defuse")
+    async def defuse(self, ctx, position: int = 0):
+        """Defuses the kitten you drew and puts it back with <position> cards above it"""
+        error = await self.act(ctx.channel, ctx.author.id, ExplodingKittensGame.defuse, position)
+        if error:
+            await ctx.send(error)
+
+    @commands.command(name="ek_status")
+    async def status(self, ctx):
+        """Shows the state of this channel's game; anyone can watch"""
+        game = self.get_game(ctx)
+        if game is None:
+            await ctx.send("No active game in this channel. Start one with !start_game.")
             return
-
-        result = game.draw_card(player_id)
-        await ctx.send(result)
-
-        if player_id not in game.players:
-            # If player exploded, check if game is over
-            if len(game.players) == 1:
-                winner = self.bot.get_user(game.players[0])
-                await ctx.send(f"The game is over! {winner.mention} wins!")
-                del self.active_games[channel_id]  # End the game
-
-        # Advance to the next turn
-        await game.next_turn()
-
-        # Display updated deck after drawing card
-        await self.display_player_deck(self.bot.get_user(player_id), game)
+        embed = discord.Embed(title="Exploding Kittens", color=discord.Color.orange())
+        embed.add_field(name="Turn", value=f"<@{game.current_player}> ({game.turns_left} to take)")
+        embed.add_field(name="Cards in deck", value=len(game.deck))
+        embed.add_field(name="Actions so far", value=len(game.log) // 4)
+        embed.add_field(name="Players", value="\n".join(
+            f"<@{player}>: {len(game.hands[player])} cards" for player in game.players), inline=False)
+        if game.phase == Phase.REACTION:
+            played_by, card, _ = game.pending
+            embed.add_field(name="Waiting on", value=f"<@{played_by}>'s {card.label} ({game.nopes} Nopes)", inline=False)
+        await ctx.send(embed=embed)
+
+    async def finish_if_over(self, channel, game):
+        if not game.is_over:
+            if game.deck:
+                return False
+            await channel.send("The deck ran out with no kittens left, so nobody wins!")
+        else:
+            winner = self.bot.get_user(game.winner)
+            await channel.send(f"The game is over! {winner.mention} wins!")
+        del self.active_games[channel.id]  # End the game
+        self.hand_messages.pop(channel.id, None)
+        self.hand_locks.pop(channel.id, None)
+        return True
 
 
 async def setup(bot):
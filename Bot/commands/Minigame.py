@@ -1,207 +1,433 @@
-import json
+import os
+import time
+import asyncio
+import typing
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord.ui import Button, View
-import random
 from pathlib import Path
 
+import config
+from setup import directories
+from games.connect4 import Connect4Board
+from games.connect4_ai import Connect4AI
+from games.connect4_store import Connect4Store, GameRecord
+from games.opening_book import get_book
+from games.leaderboard import Leaderboard
+from games.registry import GameRegistry
+from games.router import make_custom_id, router
+from games.trivia import TriviaBank, TriviaRounds
 
-# Get the absolute path to the JSON file
-json_path = Path(__file__).resolve().parent.parent / 'data' / 'trivia' / 'Sc2 Units.json'
 
-# Load the trivia data from the JSON file
-with open(json_path, "r") as file:
-    unit_data = json.load(file)
-
-# List all units in the trivia data
-units = list(unit_data.keys())
+# Get the absolute path to the trivia packs
+trivia_path = Path(__file__).resolve().parent.parent / 'data' / 'trivia'
 
 class Minigames(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.games = {}  # Dictionary to store ongoing games
-
-    @commands.command(name="connect4", help="Starts a Connect 4 game")
-    async def connect4(self, ctx, opponent: discord.Member = None):
+        self.games = GameRegistry(config.GAME_IDLE_TIMEOUT, config.GAME_MAX_PER_USER, config.GAME_MAX_PER_GUILD)
+        self.store = Connect4Store(os.path.join(directories['minigames'], 'connect4_games.sqlite3'))
+        self.trivia_bank = TriviaBank(trivia_path)  # Packs are loaded before the first question
+        self.trivia_rounds = TriviaRounds()
+        self.leaderboard = Leaderboard(os.path.join(directories['minigames'], 'trivia_scores.sqlite3'))
+
+    async def cog_load(self):
+        # Buttons on messages sent before a restart keep working; their games are loaded on the first press
+        router.attach(self.bot)
+        router.register("connect4", self.drop_piece)
+        self.evict_idle_games.start()
+        self.flush_games.start()
+        self.flush_scores.start()
+
+    async def cog_unload(self):
+        router.unregister("connect4")
+        self.evict_idle_games.cancel()
+        self.flush_games.cancel()
+        self.flush_scores.cancel()
+        self.store.close()
+        self.leaderboard.close()
+
+    @tasks.loop(seconds=60)
+    async def evict_idle_games(self):
+        """Ends games nobody has played in a while so they don't stay in memory forever."""
+        for game in self.games.pop_idle():
+            await game.abandon()
+        await asyncio.get_running_loop().run_in_executor(None, self.store.prune, config.GAME_IDLE_TIMEOUT)
+
+    @tasks.loop(seconds=config.CONNECT4_FLUSH_INTERVAL)
+    async def flush_games(self):
+        """Writes the moves made since the last flush to disk in one batch."""
+        await asyncio.get_running_loop().run_in_executor(None, self.store.flush)
+
+    @tasks.loop(seconds=config.TRIVIA_FLUSH_INTERVAL)
+    async def flush_scores(self):
+        """Writes the trivia scores changed since the last flush in one batch."""
+        await asyncio.get_running_loop().run_in_executor(None, self.leaderboard.flush)
+
+    async def drop_piece(self, interaction, game_id, action):
+        """Handles a column button press routed here by its custom_id, loading the game from disk if needed."""
+        if not action.isdigit() or not 0 <= int(action) < 7:
+            return
+        column = int(action)
+        game = self.games.get(game_id)
+        if game is None or self.games.message_of.get(game_id) != interaction.message.id:
+            # A finished game's id can be reused by a rematch; older buttons (connect4:column:N) carry no id at all
+            game = self.games.get_by_message(interaction.message.id)
+        if game is None:
+            game = await self.resume_game(interaction)
+            if game is None:
+                await interaction.response.send_message("This game is no longer running. Start a new one with !c4.", ephemeral=True)
+                return
+            if game.current_turn == "AI":
+                # The bot went down while the AI was thinking, so let it move before taking the player's turn
+                await interaction.response.defer()
+                await game.ai_move(interaction)
+                if game.game_over:
+                    return
+
+        await game.drop_piece(interaction, column)
+
+    async def resume_game(self, interaction):
+        """Rebuilds a stored game after a restart and registers it again."""
+        record = await asyncio.get_running_loop().run_in_executor(None, self.store.load_by_message, interaction.message.id)
+        if record is None:
+            return None
+
+        player1 = await self.fetch_player(interaction, record.player1_id)
+        player2 = await self.fetch_player(interaction, record.player2_id) if record.player2_id else "AI"
+        game = Connect4.from_record(record, player1, player2, self.games, self.store)
+        game.message = interaction.message
+        user_ids = [record.player1_id] if player2 == "AI" else [record.player1_id, record.player2_id]
+        self.games.add(game.game_id, game, user_ids, record.guild_id)
+        self.games.bind_message(game.game_id, record.message_id)
+        return game
+
+    async def fetch_player(self, interaction, user_id):
+        if interaction.guild is not None:
+            member = interaction.guild.get_member(user_id)
+            if member is not None:
+                return member
+        return self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
+
+    @commands.command(name="connect4", help="Starts a Connect 4 game. Usage: !connect4 [@opponent] [easy/normal/hard/expert]")
+    async def connect4(self, ctx, opponent: typing.Optional[discord.Member] = None, difficulty: str = config.CONNECT4_DEFAULT_DIFFICULTY):
         """Starts a Connect 4 game; if no opponent is specified, it will be against the AI."""
         if opponent is None:
             opponent = "AI"  # Set opponent to AI if none is provided
 
+        difficulty = difficulty.lower()
+        if difficulty not in config.CONNECT4_DIFFICULTIES:
+            await ctx.send(f"Invalid difficulty. Use one of: {', '.join(config.CONNECT4_DIFFICULTIES)}.")
+            return
+
         # Create a new game instance and store it
-        game = Connect4(ctx.author, opponent)
-        self.games[game.game_id] = game
+        game = Connect4(ctx.author, opponent, difficulty, self.games, self.store)
+        user_ids = [ctx.author.id] if opponent == "AI" else [ctx.author.id, opponent.id]
+        guild_id = ctx.guild.id if ctx.guild else None
+        error = self.games.check_limits(game.game_id, user_ids, guild_id)
+        if error:
+            await ctx.send(error)
+            return
+        self.games.add(game.game_id, game, user_ids, guild_id)
 
         # Start the game
         await game.start_game(ctx)
 
     @commands.command(name="c4", help="Shortcut command to play Connect 4")
-    async def c4(self, ctx, opponent: discord.Member = None):
-        await self.connect4(ctx, opponent)
-
-    @commands.command(name="trivia", help="Ask a trivia question about StarCraft 2 units")
-    async def trivia(self, ctx):
-        """Asks a random trivia question about StarCraft 2 units."""
-        # Randomly select a unit and an attribute
-        unit = random.choice(units)
-        attribute = random.choice(["health", "mineral_cost", "building_time", "shield", "armour"])
-
-        # Get the correct answer for the selected attribute
-        correct_answer = unit_data[unit][attribute]
-
-        # Formulate the trivia question
-        question = f"What is the {attribute} of {unit}?"
-
-        # Ask the question to the user
-        await ctx.send(question)
-
-        def check(m):
-            """Check if the response is from the same user and in the correct channel."""
-            return m.author == ctx.author and m.channel == ctx.channel
-
-        # Wait for the user's response
+    async def c4(self, ctx, opponent: typing.Optional[discord.Member] = None, difficulty: str = config.CONNECT4_DEFAULT_DIFFICULTY):
+        await self.connect4(ctx, opponent, difficulty)
+
+    @commands.command(name="gamestats", help="Shows how many minigames are running")
+    async def gamestats(self, ctx):
+        stats = self.games.stats(ctx.guild.id if ctx.guild else None)
+        embed = discord.Embed(title="Minigame Stats", color=discord.Color.blue())
+        embed.add_field(name="Live games", value=stats["live_games"])
+        embed.add_field(name="In this server", value=stats["guild_games"])
+        embed.add_field(name="Players", value=stats["players"])
+        embed.add_field(name="Memory", value=f"{stats['memory_bytes'] / 1024:.1f} KiB")
+        await ctx.send(embed=embed)
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        """Routes chat messages to the channel's open trivia question, if any."""
+        if not message.author.bot:
+            self.trivia_rounds.dispatch(message.channel.id, message.author.id, message.content)
+
+    async def ask_trivia(self, ctx, topic, players=None, single_guess=False):
+        """Asks one question in the channel and returns (winner id or None, question), or None if nothing was asked."""
+        # Reading and compiling changed packs is file I/O, so it stays off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.trivia_bank.refresh)
+        if self.trivia_rounds.is_open(ctx.channel.id):
+            await ctx.send("There's already a trivia question open in this channel!")
+            return None
+
+        question = self.trivia_bank.draw(topic)
+        if question is None:
+            topics = self.trivia_bank.topics()
+            await ctx.send(f"No questions found for that topic. Try one of: {', '.join(sorted(topics['category']))}.")
+            return None
+
+        answer = self.trivia_rounds.ask(ctx.channel.id, question, players, single_guess)
+        await ctx.send(question.text)
+
+        guild_id = ctx.guild.id if ctx.guild else 0
+        await self.load_scores(guild_id)
         try:
-            msg = await self.bot.wait_for("message", check=check, timeout=30)  # Wait for 30 seconds
+            user_id, correct = await asyncio.wait_for(answer, timeout=config.TRIVIA_ANSWER_TIMEOUT)
+        except asyncio.TimeoutError:
+            if single_guess:
+                for player in players:
+                    self.leaderboard.record(guild_id, player, False)
+            await ctx.send(f"Time's up! The correct answer was {question.answer}.")
+            return None, question
+
+        _, streak, _ = self.leaderboard.record(guild_id, user_id, correct)
+        if correct:
+            streak_note = f" That's {streak} in a row!" if streak > 1 else ""
+            await ctx.send(f"Correct, <@{user_id}>! The answer is {question.answer}.{streak_note}")
+            return user_id, question
+        await ctx.send(f"Incorrect! The correct answer was {question.answer}.")
+        return None, question
+
+    async def load_scores(self, guild_id):
+        """Reads a guild's trivia scores from disk the first time they are needed."""
+        if not self.leaderboard.is_loaded(guild_id):
+            ranking = await asyncio.get_running_loop().run_in_executor(None, self.leaderboard.load_guild, guild_id)
+            self.leaderboard.set_guild(guild_id, ranking)
+
+    @commands.command(name="leaderboard", help="Shows the trivia leaderboard for this server")
+    async def leaderboard_command(self, ctx):
+        guild_id = ctx.guild.id if ctx.guild else 0
+        await self.load_scores(guild_id)
+        top = self.leaderboard.top(guild_id, 10)
+        description = "\n".join(
+            f"{i + 1}. <@{user_id}> - {score} (best streak {best_streak})"
+            for i, (user_id, score, _, best_streak) in enumerate(top)
+        )
+        embed = discord.Embed(title="Trivia Leaderboard", description=description or "Nobody has answered a question yet!", color=discord.Color.gold())
+        rank = self.leaderboard.rank(guild_id, ctx.author.id)
+        if rank is not None:
+            embed.set_footer(text=f"Your rank: #{rank}")
+        await ctx.send(embed=embed)
+
+    @commands.command(name="rank", help="Shows your trivia rank in this server")
+    async def rank(self, ctx, member: discord.Member = None):
+        member = member or ctx.author
+        guild_id = ctx.guild.id if ctx.guild else 0
+        await self.load_scores(guild_id)
+        rank = self.leaderboard.rank(guild_id, member.id)
+        if rank is None:
+            await ctx.send(f"{member.display_name} hasn't answered any trivia yet.")
+            return
+        score, streak, best_streak = self.leaderboard.guilds[guild_id].entries[member.id]
+        await ctx.send(f"{member.display_name} is #{rank} with {score} points (streak {streak}, best {best_streak}).")
+
+    @commands.command(name="trivia", help="Ask a trivia question. Usage: !trivia [category/attribute/difficulty]")
+    async def trivia(self, ctx, *, topic: str = None):
+        """Asks a random trivia question, optionally on a single topic. Only the asker's first answer counts."""
+        await self.ask_trivia(ctx, topic, players={ctx.author.id}, single_guess=True)
+
+    @commands.command(name="triviagame", help="Plays several trivia questions for everyone in the channel. Usage: !triviagame [questions] [topic]")
+    async def triviagame(self, ctx, questions: typing.Optional[int] = 5, *, topic: str = None):
+        """Anyone can answer; the first correct answer scores the point."""
+        questions = max(1, min(questions, config.TRIVIA_MAX_QUESTIONS))
+        scores = {}
+        for _ in range(questions):
+            result = await self.ask_trivia(ctx, topic)
+            if result is None:
+                break
+            winner, _ = result
+            if winner is not None:
+                scores[winner] = scores.get(winner, 0) + 1
 
-            # Check if the answer is correct
-            if str(correct_answer) in msg.content:
-                await ctx.send(f"Correct! The {attribute} of {unit} is {correct_answer}.")
-            else:
-                await ctx.send(f"Incorrect! The correct answer was {correct_answer}.")
+        ranking = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        description = "\n".join(f"{i + 1}. <@{user_id}> - {points}" for i, (user_id, points) in enumerate(ranking))
+        embed = discord.Embed(title="Trivia Scoreboard", description=description or "Nobody scored this time!", color=discord.Color.gold())
+        await ctx.send(embed=embed)
+
+def connect4_buttons(game_id):
+    """Column buttons for a game's message; presses reach Minigames.drop_piece through the shared router."""
+    view = View(timeout=None)
+    for i in range(7):
+        view.add_item(Button(label=f"{i + 1}", custom_id=make_custom_id("connect4", game_id, i), style=discord.ButtonStyle.primary))
+    view.stop()  # Only the components are sent; discord.py keeps no View object for the message
+    return view
 
-        except TimeoutError:
-            await ctx.send("You took too long to answer!")
 
 class Connect4:
-    def __init__(self, player1, player2):
+    PIECES = ("🟥", "🟦")  # Player 1, player 2 / AI
+    EMPTY = "⬛"
+
+    def __init__(self, player1, player2, difficulty=config.CONNECT4_DEFAULT_DIFFICULTY, registry=None, store=None):
         """Initialize the Connect 4 game."""
+        self.registry = registry  # Where the game is tracked while it is live
+        self.store = store  # Where the game is saved so it survives restarts
         self.player1 = player1
         self.player2 = player2
-        self.board = [["⬛" for _ in range(7)] for _ in range(6)]  # 7 columns, 6 rows
+        self.difficulty = difficulty
+        self.ai = None
+        if player2 == "AI":
+            book = get_book() if difficulty in config.CONNECT4_BOOK_DIFFICULTIES else None
+            self.ai = Connect4AI.for_difficulty(difficulty, book)
+        self.board = Connect4Board()  # 7 columns, 6 rows
         self.current_turn = player1  # Player 1 starts
         self.game_over = False
         self.game_id = f"{player1.id}_{player2.id}" if player2 != "AI" else f"{player1.id}_AI"
-        self.buttons = [Button(label=f"{i + 1}", custom_id=f"column_{i}", style=discord.ButtonStyle.primary) for i in range(7)]
+        self.message = None
+        self.guild_id = None
+        self.channel_id = None
+
+    @classmethod
+    def from_record(cls, record, player1, player2, registry=None, store=None):
+        """Rebuilds a saved game by replaying its moves."""
+        game = cls(player1, player2, record.difficulty, registry, store)
+        for column in record.moves:
+            game.board.play(column)
+        game.current_turn = player1 if game.board.current_player == 0 else player2
+        game.guild_id = record.guild_id
+        game.channel_id = record.channel_id
+        return game
+
+    def to_record(self):
+        return GameRecord(
+            self.game_id, self.message.id, self.guild_id, self.channel_id, self.player1.id,
+            self.player2.id if self.player2 != "AI" else 0, self.difficulty,
+            self.board.pack(), bytes(self.board.moves), time.time(),
+        )
+
+    def save(self):
+        if self.store is not None:
+            self.store.save(self.to_record())
 
     async def start_game(self, ctx):
         """Starts the game and sends the initial embed with buttons."""
         embed = self.create_board_embed()
-        view = View()
-        for button in self.buttons:
-            button.callback = self.drop_piece  # Set the button callback
-            view.add_item(button)
+        self.message = await ctx.send(embed=embed, view=connect4_buttons(self.game_id))
+        self.guild_id = ctx.guild.id if ctx.guild else None
+        self.channel_id = ctx.channel.id
+        if self.registry is not None:
+            self.registry.bind_message(self.game_id, self.message.id)
+        self.save()
+
+    def finish(self):
+        """Marks the game as over and drops it from the registry and the store."""
+        self.game_over = True
+        if self.registry is not None:
+            self.registry.remove(self.game_id)
+        if self.store is not None:
+            self.store.delete(self.game_id)
+
+    async def abandon(self):
+        """Ends a game that has been idle for too long."""
+        self.finish()
+        if self.message is not None:
+            embed = self.create_board_embed()
+            embed.title = "Connect 4 - abandoned"
+            embed.description = embed.description.rsplit("\n\n", 1)[0] + "\n\nNobody moved for too long, so the game was ended."
+            try:
+                await self.message.edit(embed=embed, view=None)
+            except discord.HTTPException:
+                pass  # The message may have been deleted
 
-        await ctx.send(embed=embed, view=view)
+    def player_name(self, player):
+        return player.display_name if player != "AI" else "AI"
 
     def create_board_embed(self):
         """Creates an embed with the current state of the board."""
-        board_display = "\n".join(["".join(row) for row in self.board])
+        board_display = "\n".join(
+            "".join(self.EMPTY if cell is None else self.PIECES[cell] for cell in row) for row in self.board.rows()
+        )
         column_numbers = "1️⃣2️⃣3️⃣4️⃣5️⃣6️⃣7️⃣"  # Column numbers at the top
         return discord.Embed(
             title="Connect 4",
-            description=f"{column_numbers}\n{board_display}\n\nIt's **{self.current_turn.display_name if self.current_turn != 'AI' else 'AI'}'s** turn!",
+            description=f"{column_numbers}\n{board_display}\n\nIt's **{self.player_name(self.current_turn)}'s** turn!",
             color=discord.Color.blue()
         )
 
-    async def drop_piece(self, interaction: discord.Interaction):
+    async def drop_piece(self, interaction: discord.Interaction, column):
         """Handles a button press to drop a piece into a column."""
         if self.game_over:
-            await interaction.response.send_message("The game is over. Please start a new game!", ephemeral=True)
+            await self.reply(interaction, "The game is over. Please start a new game!")
             return
 
-        # Determine which column the button refers to
-        column = int(interaction.data["custom_id"].split("_")[1])
+        if interaction.user != self.current_turn:
+            await self.reply(interaction, "It's not your turn!")
+            return
 
-        # Find the lowest available row in the column
-        for row in reversed(range(6)):
-            if self.board[row][column] == "⬛":  # Empty spot
-                self.board[row][column] = "🟥" if self.current_turn == self.player1 else "🟦"
-                break
-        else:
-            await interaction.response.send_message("This column is full! Choose another one.", ephemeral=True)
+        if not self.board.can_play(column):
+            await self.reply(interaction, "This column is full! Choose another one.")
             return
 
-        # Log the move made by the player or AI
-        print(f"Move made by {self.current_turn.display_name if self.current_turn != 'AI' else 'AI'} in column {column + 1}")
+        self.board.play(column)
+        self.save()
+        if self.registry is not None:
+            self.registry.touch(self.game_id)
+
+        # Log the move made by the player
+        print(f"Move made by {self.player_name(self.current_turn)} in column {column + 1}")
 
         # Check for a win or tie
-        if self.check_win():
-            embed = self.create_board_embed()
-            embed.title = f"{self.current_turn.display_name if self.current_turn != 'AI' else 'AI'} wins!"
-            await interaction.response.edit_message(embed=embed, view=None)
-            self.game_over = True
+        if await self.check_game_end(interaction):
             return
 
         # Switch to the next player
-        if self.current_turn != "AI":
-            self.current_turn = self.player2 if self.current_turn == self.player1 else self.player1
-            # Let AI play after the player's turn
-            if self.current_turn == "AI":
-                await self.ai_move(interaction)
+        self.current_turn = self.player2 if self.current_turn == self.player1 else self.player1
 
         # Update the board in the message
         embed = self.create_board_embed()
-        await interaction.response.edit_message(embed=embed)
+        await self.update_message(interaction, embed=embed)
+
+        # Let AI play after the player's turn
+        if self.current_turn == "AI":
+            await self.ai_move(interaction)
+
+    async def check_game_end(self, interaction):
+        """Ends the game if the last move won or filled the board."""
+        if self.board.last_move_won():
+            title = f"{self.player_name(self.current_turn)} wins!"
+        elif self.board.is_full():
+            title = "It's a tie!"
+        else:
+            return False
+
+        self.finish()
+        embed = self.create_board_embed()
+        embed.title = title
+        await self.update_message(interaction, embed=embed, view=None)
+        return True
+
+    async def reply(self, interaction, text):
+        """Sends a private note to whoever pressed the button."""
+        if interaction.response.is_done():
+            await interaction.followup.send(text, ephemeral=True)
+        else:
+            await interaction.response.send_message(text, ephemeral=True)
+
+    async def update_message(self, interaction, **kwargs):
+        """Edits the game message, whether or not the interaction has been responded to yet."""
+        if interaction.response.is_done():
+            await interaction.edit_original_response(**kwargs)
+        else:
+            await interaction.response.edit_message(**kwargs)
 
     async def ai_move(self, interaction):
-        """AI makes its move based on a heuristic strategy."""
-        # AI tries to win, then blocks the player, or takes a random move
-        move = self.get_best_move("🟦") or self.get_best_move("🟥")
-        if move is None:
-            available_columns = [col for col in range(7) if self.board[0][col] == "⬛"]
-            move = random.choice(available_columns)
-
-        # Drop the AI piece in the selected column
-        for row in reversed(range(6)):
-            if self.board[row][move] == "⬛":
-                self.board[row][move] = "🟦"
-                break
+        """AI searches for its move in a worker thread so other games keep running."""
+        loop = asyncio.get_running_loop()
+        move = await loop.run_in_executor(None, self.ai.choose_move, self.board)
+
+        self.board.play(move)
+        self.save()
 
         # Log the AI move
         print(f"AI moves in column {move + 1}")
 
         # Check if AI wins after its move
-        if self.check_win():
-            embed = self.create_board_embed()
-            embed.title = f"AI wins!"
-            await interaction.response.edit_message(embed=embed, view=None)
-            self.game_over = True
+        if await self.check_game_end(interaction):
             return
 
         # Switch to the player's turn after AI's move
         self.current_turn = self.player1
-
-    def get_best_move(self, piece):
-        """Returns the best move for the AI or player."""
-        for col in range(7):
-            if self.board[0][col] == "⬛":  # Check if the column is not full
-                for row in reversed(range(6)):
-                    if self.board[row][col] == "⬛":
-                        self.board[row][col] = piece
-                        if self.check_win():
-                            self.board[row][col] = "⬛"  # Undo the move
-                            return col  # This is the winning move
-                        self.board[row][col] = "⬛"  # Undo the move
-                        break
-        return None
-
-    def check_win(self):
-        """Check for a Connect 4 win condition."""
-        for row in range(6):
-            for col in range(7):
-                if self.board[row][col] == "⬛":
-                    continue
-                if self.check_direction(row, col, 1, 0) or self.check_direction(row, col, 0, 1) or self.check_direction(row, col, 1, 1) or self.check_direction(row, col, 1, -1):
-                    return True
-        return False
-
-    def check_direction(self, row, col, row_dir, col_dir):
-        """Checks if there are 4 pieces in a line from the (row, col) point."""
-        piece = self.board[row][col]
-        for i in range(1, 4):
-            r, c = row + row_dir * i, col + col_dir * i
-            if not (0 <= r < 6 and 0 <= c < 7) or self.board[r][c] != piece:
-                return False
-        return True
+        await self.update_message(interaction, embed=self.create_board_embed())
 
 # Add this cog to the bot
 async def setup(bot):
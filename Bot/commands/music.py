@@ -1,50 +1,255 @@
-# Import Statements
-import os
-import random
-import time
 import asyncio
+import io
+import itertools
 import json
-import math
-import wave
-from pathlib import Path
-import asyncio
+import os
 import re
 
-
 import discord
 from discord.ext import commands, tasks
-from discord import FFmpegPCMAudio, PCMVolumeTransformer
-from discord.ext import commands
 from discord.ui import Button, View
 
-from gpt4all import GPT4All
-import fitz  # PyMuPDF
-from dotenv import load_dotenv
-import yt_dlp as youtube_dl
-import yt_dlp
+import config
+from setup import directories
+from audio.cache import AudioCache
+from audio.extractor import Extractor, ExtractionError
+from audio.player import GuildPlayer
+from audio.playlists import PlaylistError, PlaylistStore
+from audio.sessions import VoiceSessions
+from audio.tracks import DEFAULT_THUMBNAIL, Track, TrackCache
+
+YDL_OPTIONS = {
+    'format': 'bestaudio/best',
+    'noplaylist': True,
+    'default_search': 'ytsearch',
+    'quiet': True,
+}
+
+# Playlist links are read as metadata only; each entry's stream is looked up when it nears the front of the queue
+FLAT_YDL_OPTIONS = dict(YDL_OPTIONS, extract_flat='in_playlist')
 
-import pafy
-import pyaudio
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-import pandas as pd
-from fuzzywuzzy import process
+# Let FFmpeg reconnect to dropped streams instead of ending the song early
+FFMPEG_BEFORE_OPTIONS = '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
+FFMPEG_OPTIONS = '-vn'
 
 
+class MusicControlsView(View):
+    """Now-playing buttons shared by every guild; presses act on the player of the guild they came from."""
+
+    ACTIONS = ('pause', 'resume', 'skip', 'loop')
+
+    def __init__(self, cog):
+        super().__init__(timeout=None)
+        for action in self.ACTIONS:
+            button = Button(label=action.capitalize(), custom_id=f"music:{action}", style=discord.ButtonStyle.primary)
+            button.callback = self.make_callback(cog, action)
+            self.add_item(button)
+
+    @staticmethod
+    def make_callback(cog, action):
+        async def callback(interaction):
+            await cog.control(interaction, action)
+        return callback
 
 
 class Music(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.queue = []
-        self.loop = False
-        self.loop_single = False
+        self.players = {}  # guild_id -> GuildPlayer, created on first use
+        self.extractor = Extractor(config.MUSIC_EXTRACT_WORKERS, config.MUSIC_EXTRACT_PER_GUILD, config.MUSIC_EXTRACT_TIMEOUT)
+        self.tracks = TrackCache(config.MUSIC_TRACK_CACHE_SIZE, config.MUSIC_TRACK_CACHE_TTL)
+        self.sessions = VoiceSessions(config.MUSIC_IDLE_TIMEOUT)
+        self.reconnect_watches = {}  # guild_id -> task waiting for a dropped voice connection to come back
+        self.controls_view = MusicControlsView(self)  # Shared by every guild's now-playing message
+        self.playlists = PlaylistStore(os.path.join(directories['playlists'], 'playlists.sqlite3'))
+        self.audio_cache = None
+        if config.MUSIC_CACHE_MAX_MB > 0:
+            self.audio_cache = AudioCache(directories['audio_cache'], config.MUSIC_CACHE_MAX_MB * 1024 * 1024,
+                                          config.MUSIC_CACHE_MIN_PLAYS)
+
+    async def cog_load(self):
+        # Buttons on now-playing messages sent before a restart keep working
+        self.bot.add_view(self.controls_view)
+        self.disconnect_idle.start()
+
+    async def cog_unload(self):
+        self.disconnect_idle.cancel()
+        for task in self.reconnect_watches.values():
+            task.cancel()
+        self.extractor.shutdown()
+        if self.audio_cache is not None:
+            self.audio_cache.shutdown()
+        self.playlists.close()
+
+    def get_player(self, guild):
+        player = self.players.get(guild.id)
+        if player is None:
+            player = self.players[guild.id] = GuildPlayer(guild.id, config.MUSIC_HISTORY_SIZE)
+        return player
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member, before, after):
+        # Stop looking up songs for someone who has left the voice channel
+        if before.channel is not None and after.channel != before.channel:
+            self.extractor.cancel_requester(member.guild.id, member.id)
+
+        if member.id != self.bot.user.id:
+            return
+        session = self.sessions.get(member.guild.id)
+        if after.channel is not None:
+            if session is not None:
+                session.channel_id = after.channel.id  # Moved to another channel
+            return
+
+        if session is None or session.leaving:
+            # We left on purpose, so drop the guild's queue
+            self.sessions.end(member.guild.id)
+            self.remove_player(member.guild.id)
+        else:
+            # Either discord.py is reconnecting after a dropped connection, or someone disconnected the bot
+            self.watch_reconnect(member.guild, session)
+
+    def remove_player(self, guild_id):
+        player = self.players.pop(guild_id, None)
+        if player is not None:
+            player.close()
+
+    async def connect(self, channel):
+        """Joins a voice channel, or moves there if already connected in the guild, and starts tracking the session."""
+        voice_client = channel.guild.voice_client
+        if voice_client is not None:
+            await voice_client.move_to(channel)
+        else:
+            voice_client = await channel.connect(timeout=config.MUSIC_CONNECT_TIMEOUT, reconnect=True)
+        session = self.sessions.get(channel.guild.id)
+        if session is None:
+            self.sessions.start(channel.guild.id, channel.id)
+        else:
+            session.channel_id = channel.id
+        return voice_client
+
+    async def disconnect(self, guild):
+        """Leaves voice on purpose, dropping the guild's queue."""
+        session = self.sessions.end(guild.id)
+        if session is not None:
+            session.leaving = True
+        self.remove_player(guild.id)
+        if guild.voice_client is not None:
+            await guild.voice_client.disconnect()
+
+    async def ensure_voice(self, ctx):
+        """The guild's voice client, joining the author's channel first if the bot isn't connected; None if it can't."""
+        voice_client = discord.utils.get(self.bot.voice_clients, guild=ctx.guild)
+        if voice_client is not None:
+            if self.sessions.get(ctx.guild.id) is None:
+                self.sessions.start(ctx.guild.id, voice_client.channel.id)
+            return voice_client
+        if not ctx.author.voice:
+            await ctx.send('You are not connected to a voice channel.')
+            return None
+        try:
+            return await self.connect(ctx.author.voice.channel)
+        except (asyncio.TimeoutError, discord.ClientException) as error:
+            await ctx.send(f"Couldn't join {ctx.author.voice.channel}: {error or 'timed out'}")
+            return None
+
+    def watch_reconnect(self, guild, session):
+        """Starts waiting for the guild's voice connection to come back, unless that's already happening."""
+        task = self.reconnect_watches.get(guild.id)
+        if task is not None and not task.done():
+            return
+        task = self.reconnect_watches[guild.id] = asyncio.create_task(self.await_reconnect(guild, session))
+        task.add_done_callback(lambda task: self.reconnect_watch_done(guild, session, task))
+
+    def reconnect_watch_done(self, guild, session, task):
+        if self.reconnect_watches.get(guild.id) is task:
+            del self.reconnect_watches[guild.id]
+        if task.cancelled() or task.exception() is None:
+            return
+        error = task.exception()
+        print(f"Waiting for the voice connection in {guild} failed: {type(error).__name__}: {error}")
+        if self.sessions.get(guild.id) is session:
+            self.sessions.end(guild.id)
+            self.remove_player(guild.id)
+
+    async def await_reconnect(self, guild, session):
+        """Waits for discord.py's own reconnect (reconnect=True) and resumes the current song if it stopped.
+
+        The bot never rejoins by itself: after a forced disconnect, e.g. by a moderator, discord.py stays out and
+        drops the voice client, and so does this, clearing the guild's queue.
+        """
+        player = self.players.get(guild.id)
+        deadline = asyncio.get_running_loop().time() + config.MUSIC_RECONNECT_WAIT
+        while asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(1)
+            if self.sessions.get(guild.id) is not session:
+                return  # Someone made the bot leave or join elsewhere in the meantime
+            voice_client = guild.voice_client
+            if voice_client is None:
+                break  # Disconnected for good
+            if not voice_client.is_connected():
+                continue
+
+            self.sessions.record_reconnect(session)
+            if voice_client.is_playing() or voice_client.is_paused():
+                # The audio player waited out the outage and carried on, so there's nothing to resume
+                if player is not None:
+                    player.seek_to = None
+            elif player is not None and player.current is not None:
+                await self.play_next(guild)  # seek_to, set if playback failed, resumes the same song
+            return
+
+        self.sessions.end(guild.id)
+        self.remove_player(guild.id)
+        if guild.voice_client is not None:
+            await guild.voice_client.disconnect(force=True)  # Gave up on a reconnect that never finished
+        if player is not None and player.text_channel is not None:
+            await player.text_channel.send("Disconnected from voice, so the queue was cleared.")
+
+    def track_finished(self, guild, error):
+        """The after callback of voice_client.play, called from the audio thread."""
+        if error is not None:
+            print(f"Playback failed in {guild}: {error}")
+            player = self.players.get(guild.id)
+            if player is not None and player.current is not None:
+                player.seek_to = player.position()  # Pick up where it broke off rather than skipping the song
+        voice_client = guild.voice_client
+        if voice_client is not None and not voice_client.is_connected():
+            session = self.sessions.get(guild.id)
+            if session is not None:
+                # Playback resumes once discord.py has the connection back
+                self.bot.loop.call_soon_threadsafe(self.watch_reconnect, guild, session)
+            return
+        asyncio.run_coroutine_threadsafe(self.play_next(guild), self.bot.loop)
+
+    @tasks.loop(seconds=30)
+    async def disconnect_idle(self):
+        """Leaves voice channels where nothing has played to anyone for a while."""
+        for session in list(self.sessions.sessions.values()):
+            guild = self.bot.get_guild(session.guild_id)
+            voice_client = guild.voice_client if guild is not None else None
+            if voice_client is not None and voice_client.is_playing() and any(not m.bot for m in voice_client.channel.members):
+                session.touch()
+
+        for session in self.sessions.idle():
+            guild = self.bot.get_guild(session.guild_id)
+            if guild is None:
+                self.sessions.end(session.guild_id)
+                continue
+            player = self.players.get(guild.id)
+            if player is not None and player.text_channel is not None:
+                await player.text_channel.send("Left the voice channel after being idle for a while.")
+            await self.disconnect(guild)
 
     @commands.command(name='join', help='Joins the voice channel that the user is in')
     async def join(self, ctx):
         if ctx.author.voice:
             channel = ctx.author.voice.channel
-            await channel.connect()
+            try:
+                await self.connect(channel)
+            except (asyncio.TimeoutError, discord.ClientException) as error:
+                await ctx.send(f"Couldn't join {channel}: {error or 'timed out'}")
+                return
             await ctx.send(f'Joined {channel}')
         else:
             await ctx.send('You are not connected to a voice channel.')
@@ -53,11 +258,32 @@ class Music(commands.Cog):
     async def leave(self, ctx):
         voice_client = discord.utils.get(self.bot.voice_clients, guild=ctx.guild)
         if voice_client:
-            await voice_client.disconnect()
+            await self.disconnect(ctx.guild)
             await ctx.send('Disconnected from the voice channel.')
         else:
             await ctx.send('I am not connected to a voice channel.')
 
+    @commands.command(name='voicestats', help='Shows voice connection stats for this server')
+    async def voicestats(self, ctx):
+        session = self.sessions.get(ctx.guild.id)
+        embed = discord.Embed(title="Voice Stats", color=discord.Color.blue())
+        embed.add_field(name="Connected servers", value=len(self.sessions.sessions))
+        embed.add_field(name="Reconnects (all servers)", value=self.sessions.total_reconnects)
+        if session is None:
+            embed.add_field(name="This server", value="Not connected", inline=False)
+        else:
+            player = self.players.get(ctx.guild.id)
+            channel = ctx.guild.get_channel(session.channel_id)
+            embed.add_field(name="Channel", value=channel.mention if channel else "Unknown")
+            embed.add_field(name="Connected for", value=f"{session.connected_for() / 60:.0f} min")
+            embed.add_field(name="Idle for", value=f"{session.idle_for():.0f} s")
+            embed.add_field(name="Songs played", value=session.tracks_played)
+            embed.add_field(name="Reconnects", value=session.reconnects)
+            embed.add_field(name="Queued", value=len(player) if player is not None else 0)
+            if ctx.guild.voice_client is not None:
+                embed.add_field(name="Latency", value=f"{ctx.guild.voice_client.average_latency * 1000:.0f} ms")
+        await ctx.send(embed=embed)
+
     @commands.command()
     async def volume(self, ctx, volume: int):
         """Changes the player's volume"""
@@ -65,101 +291,334 @@ class Music(commands.Cog):
         if ctx.voice_client is None:
             return await ctx.send("Not connected to a voice channel.")
 
-        ctx.voice_client.source.volume = volume / 100
+        player = self.get_player(ctx.guild)
+        player.volume = max(0, min(volume, 200)) / 100
+        source = ctx.voice_client.source
+        if isinstance(source, discord.PCMVolumeTransformer):
+            source.volume = player.volume
+        elif player.current is not None and player.volume != 1.0:
+            # Opus passthrough can't change volume, so restart the song where it is through the PCM path
+            player.seek_to = player.position()
+            ctx.voice_client.stop()
+
+        # The warmed-up next song was opened for the old volume
+        player.discard_prepared()
+        if player.current is not None:
+            self.start_prefetch(player)
         await ctx.send(f"Changed volume to {volume}%")
 
-    @commands.command(name='play', aliases=['Play'], help='Plays a song from YouTube')
+    @commands.command(name='play', aliases=['Play'], help='Plays songs or a playlist link from YouTube. Separate several songs with |')
     async def play(self, ctx, *, search: str = None):
         if search is None:
-            await ctx.send('Usage: !play [song title]')
+            await ctx.send('Usage: !play [song title, link or playlist link]')
             return
 
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'noplaylist': True,
-            'default_search': 'ytsearch',
-            'quiet': True,
-        }
-
-        with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(search, download=False)
-            url = info['entries'][0]['url']
-            title = info['entries'][0]['title']
-
-        voice_client = discord.utils.get(self.bot.voice_clients, guild=ctx.guild)
-
+        voice_client = await self.ensure_voice(ctx)
         if voice_client is None:
-            await ctx.send('I am not connected to a voice channel.')
             return
 
-        self.queue.append((url, title))
-
-        if not voice_client.is_playing():
-            await self.play_next(ctx)
-
-        await ctx.send(f'Added to queue: {title}')
-
-    async def play_next(self, ctx):
-        if self.queue:
-            url, title = self.queue.pop(0)
-            voice_client = discord.utils.get(self.bot.voice_clients, guild=ctx.guild)
-
-            with youtube_dl.YoutubeDL({'quiet': True}) as ydl:
-                info = ydl.extract_info(url, download=False)
-                thumbnail = info.get('thumbnail', 'https://example.com/default_thumbnail.jpg')
-
-            if not re.match(r'^https?://', thumbnail):
-                thumbnail = 'https://example.com/default_thumbnail.jpg'
-
-            embed = discord.Embed(title="Now Playing", description=title, color=0x00ff00)
-            embed.set_image(url=thumbnail)
+        queries = [query.strip() for query in re.split(r'[|\n]', search) if query.strip()]
+        if len(queries) > config.MUSIC_QUERY_MAX:
+            await ctx.send(f'You can add at most {config.MUSIC_QUERY_MAX} songs at once.')
+            return
 
-            async def pause_callback(interaction):
-                if voice_client.is_playing():
-                    voice_client.pause()
-                    await interaction.response.send_message("Paused the current song.", ephemeral=True)
+        try:
+            tracks = await self.find_tracks(queries, ctx.guild.id, ctx.author.id)
+        except ExtractionError as error:
+            await ctx.send(str(error))
+            return
 
-            async def resume_callback(interaction):
-                if voice_client.is_paused():
-                    voice_client.resume()
-                    await interaction.response.send_message("Resumed the current song.", ephemeral=True)
+        if not tracks:
+            await ctx.send(f'No results found for: {search}')
+            return
 
-            async def skip_callback(interaction):
-                if voice_client.is_playing():
-                    voice_client.stop()
-                    await interaction.response.send_message("Skipped the current song.", ephemeral=True)
-                    await self.play_next(ctx)
+        player = self.get_player(ctx.guild)
+        player.text_channel = ctx.channel
+        player.enqueue_many(tracks)
 
-            async def loop_callback(interaction):
-                self.loop = not self.loop
-                self.loop_single = False
-                await interaction.response.send_message(f"Looping is now {'enabled' if self.loop else 'disabled'}.", ephemeral=True)
+        if player.current is None and not voice_client.is_playing() and not voice_client.is_paused():
+            await self.play_next(ctx.guild)
+        else:
+            self.start_prefetch(player)  # The new tracks may be among the next few
 
-            pause_button = Button(label="Pause", style=discord.ButtonStyle.primary)
-            pause_button.callback = pause_callback
+        if len(tracks) == 1:
+            await ctx.send(f'Added to queue: {tracks[0].title}')
+        else:
+            await ctx.send(f'Added {len(tracks)} songs to the queue.')
+
+    async def find_tracks(self, queries, guild_id, requester_id=None):
+        """The tracks for a !play request: one search, one link, a whole playlist, or several songs at once."""
+        if len(queries) > 1:
+            # Searching each one now would hold up the whole batch, so searches are looked up as they near the
+            # front. Links are listed now, side by side, so that playlist links expand into their songs.
+            links = [query for query in queries if re.match(r'^https?://', query)]
+            results = await asyncio.gather(*(self.find_link_tracks(link, guild_id, requester_id) for link in links),
+                                           return_exceptions=True)
+            found = dict(zip(links, results))
+            tracks = []
+            for query in queries:
+                result = found.get(query)
+                if result is None:
+                    tracks.append(self.tracks.get_query(query) or Track.from_search(query))
+                elif isinstance(result, ExtractionError):
+                    tracks.append(Track.from_link(query))  # Tried again, and reported if it still fails, when it comes up
+                elif isinstance(result, BaseException):
+                    raise result
+                else:
+                    tracks.extend(result)
+            return tracks
+
+        query = queries[0]
+        if not re.match(r'^https?://', query):
+            track = await self.search_track(query, guild_id, requester_id)
+            return [track] if track is not None else []
+        return await self.find_link_tracks(query, guild_id, requester_id)
+
+    async def find_link_tracks(self, query, guild_id, requester_id=None):
+        """The track for a video link, or every entry of a playlist link."""
+        track = self.tracks.get_query(query)
+        if track is not None:
+            return [track]
+
+        # One request either resolves a single video or lists a playlist's entries without resolving them
+        info = await self.extractor.extract(query, FLAT_YDL_OPTIONS, guild_id, requester_id)
+        entries = info.get('entries')
+        if entries is None:
+            return [self.cache_info(info, query)]
+
+        tracks = []
+        for entry in itertools.islice(entries, config.MUSIC_PLAYLIST_MAX):
+            if entry and (entry.get('url') or entry.get('webpage_url')):
+                tracks.append(self.tracks.get(entry.get('id')) or Track.from_flat(entry))
+        return tracks
+
+    async def search_track(self, search, guild_id, requester_id=None):
+        """Finds the track for a search, extracting it only if it isn't cached yet."""
+        track = self.tracks.get_query(search)
+        if track is not None:
+            return track
+
+        info = await self.extractor.extract(search, YDL_OPTIONS, guild_id, requester_id)
+        entries = info.get('entries')
+        if entries is not None:
+            if not entries:
+                return None
+            info = entries[0]
+
+        return self.cache_info(info, search)
+
+    def cache_info(self, info, query=None):
+        """Turns a fully extracted entry into a cached track, refreshing the stream of one already cached."""
+        track = self.tracks.get(info.get('id'))
+        if track is None:
+            track = Track.from_info(info, config.MUSIC_STREAM_TTL)
+        else:
+            track.update_stream(info, config.MUSIC_STREAM_TTL)
+        self.tracks.put(track, query)
+        return track
+
+    async def resolve_stream(self, track, guild_id, margin=60):
+        """Makes sure the track's stream URL stays valid for `margin` seconds, extracting a fresh one if needed."""
+        if track.stream_expired(margin):
+            info = await self.extractor.extract(track.webpage_url, YDL_OPTIONS, guild_id)
+            if 'entries' in info:
+                # Imported playlist entries can be searches rather than links
+                if not info['entries']:
+                    raise ExtractionError(f"No results found for: {track.title}")
+                info = info['entries'][0]
+            track.update_stream(info, config.MUSIC_STREAM_TTL)
+        return track.stream_url
+
+    async def play_next(self, guild):
+        """Starts the guild's next track, looping or moving on according to its loop mode."""
+        player = self.players.get(guild.id)
+        voice_client = discord.utils.get(self.bot.voice_clients, guild=guild)
+        if player is None or voice_client is None:
+            return
 
-            resume_button = Button(label="Resume", style=discord.ButtonStyle.primary)
-            resume_button.callback = resume_callback
+        # Every failure drops its track, so this many attempts covers the whole queue even if nothing will play
+        for _ in range(len(player.queue) + 1):
+            track = player.advance()
+            if track is None:
+                return
+
+            # A seek restarts the current song (e.g. after a volume change) rather than starting a new one
+            position, player.seek_to = player.seek_to, None
+
+            source = player.take_prepared(track) if position is None else None
+            if source is not None:
+                break
+            try:
+                source = await self.open_source(track, guild.id, volume=player.volume, position=position)
+                break
+            except ExtractionError as error:
+                await player.text_channel.send(f"Skipping {track.title}: {error}")
+                player.current = None  # So advance() neither repeats it nor loops it back onto the queue
+        else:
+            await player.text_channel.send("Stopped: none of the queued songs could be played.")
+            return
 
-            skip_button = Button(label="Skip", style=discord.ButtonStyle.primary)
-            skip_button.callback = skip_callback
+        embed = discord.Embed(title="Now Playing", description=f"{track.title} ({track.duration_text})", color=0x00ff00)
+        embed.set_image(url=track.thumbnail or DEFAULT_THUMBNAIL)  # Cached files play without a lookup
 
-            loop_button = Button(label="Loop", style=discord.ButtonStyle.primary)
-            loop_button.callback = loop_callback
+        still_paused = position is not None and player.paused_at is not None
+        voice_client.play(source, after=lambda error: self.track_finished(guild, error))
+        player.start_clock(position or 0)
+        if still_paused:
+            # Restarted while paused (a volume change or a reconnect), so it stays paused
+            voice_client.pause()
+            player.pause_clock()
+        self.start_prefetch(player)
+        if position is not None:
+            return
+        session = self.sessions.get(guild.id)
+        if session is not None:
+            session.tracks_played += 1
+            session.touch()
+        if self.audio_cache is not None and self.audio_cache.record_play(track):
+            self.audio_cache.start_download(track)
+        await self.show_now_playing(player, embed)
+
+    async def show_now_playing(self, player, embed):
+        """Edits the guild's now-playing message for the new track, only sending a new one when there isn't one to edit."""
+        message = player.now_playing
+        if message is not None and message.channel.id == player.text_channel.id:
+            try:
+                await message.edit(embed=embed, view=self.controls_view)
+                return
+            except discord.HTTPException:
+                pass  # Deleted or otherwise gone, so send a fresh one
+        player.now_playing = await player.text_channel.send(embed=embed, view=self.controls_view)
+
+    async def control(self, interaction, action):
+        """Handles a press on the now-playing buttons for whichever guild it came from."""
+        voice_client = discord.utils.get(self.bot.voice_clients, guild=interaction.guild)
+        player = self.players.get(interaction.guild_id)
+        if voice_client is None or player is None:
+            await interaction.response.send_message("Nothing is playing right now.", ephemeral=True)
+            return
 
-            view = View()
-            view.add_item(pause_button)
-            view.add_item(resume_button)
-            view.add_item(skip_button)
-            view.add_item(loop_button)
+        if action == 'pause':
+            if voice_client.is_playing():
+                self.pause_playback(interaction.guild, voice_client)
+                message = "Paused the current song."
+            else:
+                message = "No song is currently playing."
+        elif action == 'resume':
+            if voice_client.is_paused():
+                self.resume_playback(interaction.guild, voice_client)
+                message = "Resumed the current song."
+            else:
+                message = "No song is currently paused."
+        elif action == 'skip':
+            if voice_client.is_playing() or voice_client.is_paused():
+                # Stopping runs the after callback, which starts the next song
+                player.skip_requested = True
+                voice_client.stop()
+                message = "Skipped the current song."
+            else:
+                message = "No song is currently playing."
+        else:
+            player.loop_mode = 'off' if player.loop_mode == 'queue' else 'queue'
+            message = f"Looping is now {'enabled' if player.loop_mode == 'queue' else 'disabled'}."
+        await interaction.response.send_message(message, ephemeral=True)
+
+    def pause_playback(self, guild, voice_client):
+        voice_client.pause()
+        player = self.players.get(guild.id)
+        if player is not None:
+            player.pause_clock()
+
+    def resume_playback(self, guild, voice_client):
+        voice_client.resume()
+        player = self.players.get(guild.id)
+        if player is not None:
+            player.resume_clock()
+            self.start_prefetch(player)  # The next song's warm-up was timed before the pause
+
+    async def open_source(self, track, guild_id, margin=60, volume=1.0, position=None):
+        """Starts FFmpeg for a track.
+
+        Opus audio (cached files, and streams whose codec is opus) is passed through to Discord without
+        decoding; only a volume other than 100% needs the PCM path with its decode and re-encode.
+        """
+        seek = f'-ss {position:.2f} ' if position else ''
+        path = self.audio_cache.lookup(track.video_id) if self.audio_cache is not None else None
+        if path is not None:
+            source, before_options, codec = path, seek, 'opus'
+        else:
+            source = await self.resolve_stream(track, guild_id, margin)
+            before_options = seek + FFMPEG_BEFORE_OPTIONS
+            codec = await self.probe_codec(track)
+
+        if volume == 1.0 and codec == 'opus':
+            return discord.FFmpegOpusAudio(source, codec='copy', before_options=before_options or None, options=FFMPEG_OPTIONS)
+        audio = discord.FFmpegPCMAudio(source, before_options=before_options or None, options=FFMPEG_OPTIONS)
+        return discord.PCMVolumeTransformer(audio, volume)
+
+    async def probe_codec(self, track):
+        """The stream's audio codec, from yt-dlp's metadata or else a single ffprobe run per stream URL."""
+        if track.acodec is None:
+            try:
+                track.acodec, _ = await discord.FFmpegOpusAudio.probe(track.stream_url)
+            except Exception as error:  # Probing is only an optimisation, so any failure means PCM
+                print(f"Couldn't probe {track.title}: {error}")
+            if track.acodec is None:
+                track.acodec = 'unknown'
+        return track.acodec
+
+    def start_prefetch(self, player):
+        if player.prefetch_task is not None:
+            player.prefetch_task.cancel()
+        player.prefetch_task = asyncio.create_task(self.prefetch(player))
+
+    async def prefetch(self, player):
+        """Resolves the upcoming tracks while the current one plays, then starts FFmpeg for the next one just before it's needed."""
+        upcoming = player.upcoming(config.MUSIC_PREFETCH_COUNT)
+        if not upcoming:
+            return
 
-            voice_client.play(discord.FFmpegPCMAudio(url), after=lambda e: asyncio.run_coroutine_threadsafe(self.play_next(ctx), self.bot.loop))
-            await ctx.send(embed=embed, view=view)
+        # Resolve them side by side (the extractor bounds how many run at once); each URL has
+        # to stay valid until its track has finished playing
+        starts_in = player.remaining() or 0
+        lookups = []
+        for track in upcoming:
+            lookups.append(self.resolve_stream(track, player.guild_id, margin=starts_in + (track.duration or 0) + 60))
+            starts_in += track.duration or 0
+        # Errors are ignored here; play_next retries and reports them when the track comes up
+        await asyncio.gather(*lookups, return_exceptions=True)
+
+        remaining = player.remaining()
+        if remaining is None:
+            return  # Live streams have no known end to prepare for
+        await asyncio.sleep(max(0.0, remaining - config.MUSIC_WARMUP_LEAD))
+        if player.paused_at is not None:
+            return  # Paused before the warm-up; resuming starts the prefetch again
+
+        next_tracks = player.upcoming(1)
+        if not next_tracks:
+            return
+        track = next_tracks[0]
+        try:
+            source = await self.open_source(track, player.guild_id, margin=(track.duration or 0) + 60, volume=player.volume)
+        except ExtractionError:
+            return
+        player.prepare(track, source)
 
     @commands.command(name='queue', help='Displays the current song queue')
     async def queue(self, ctx):
-        if self.queue:
-            embed = discord.Embed(title="Queue", description="\n".join([f"{i + 1}. {title}" for i, (_, title) in enumerate(self.queue)]), color=0x00ff00)
+        player = self.players.get(ctx.guild.id)
+        if player is not None and (player.current or player.queue):
+            lines = []
+            if player.current is not None:
+                lines.append(f"Now playing: {player.current.title} ({player.current.duration_text})")
+            # Only the first page of a long queue is shown
+            for i, track in enumerate(itertools.islice(player.queue, 20)):
+                lines.append(f"{i + 1}. {track.title} ({track.duration_text})")
+            if len(player.queue) > 20:
+                lines.append(f"...and {len(player.queue) - 20} more")
+            embed = discord.Embed(title="Queue", description="\n".join(lines), color=0x00ff00)
+            embed.set_footer(text=f"Loop: {player.loop_mode}")
         else:
             embed = discord.Embed(title="Queue", description="The queue is empty.", color=0x00ff00)
 
@@ -169,7 +628,8 @@ class Music(commands.Cog):
     async def skip(self, ctx):
         voice_client = discord.utils.get(self.bot.voice_clients, guild=ctx.guild)
 
-        if voice_client.is_playing():
+        if voice_client and (voice_client.is_playing() or voice_client.is_paused()):
+            self.get_player(ctx.guild).skip_requested = True
             voice_client.stop()
             await ctx.send("Skipped the current song.")
         else:
@@ -179,8 +639,8 @@ class Music(commands.Cog):
     async def pause(self, ctx):
         voice_client = discord.utils.get(self.bot.voice_clients, guild=ctx.guild)
 
-        if voice_client.is_playing():
-            voice_client.pause()
+        if voice_client and voice_client.is_playing():
+            self.pause_playback(ctx.guild, voice_client)
             await ctx.send("Paused the current song.")
         else:
             await ctx.send("No song is currently playing.")
@@ -189,8 +649,8 @@ class Music(commands.Cog):
     async def resume(self, ctx):
         voice_client = discord.utils.get(self.bot.voice_clients, guild=ctx.guild)
 
-        if voice_client.is_paused():
-            voice_client.resume()
+        if voice_client and voice_client.is_paused():
+            self.resume_playback(ctx.guild, voice_client)
             await ctx.send("Resumed the current song.")
         else:
             await ctx.send("No song is currently paused.")
@@ -202,22 +662,176 @@ class Music(commands.Cog):
             return
 
         mode = mode.lower()
+        player = self.get_player(ctx.guild)
 
         if mode == 'queue':
-            self.loop = True
-            self.loop_single = False
+            player.loop_mode = 'queue'
             await ctx.send("Looping the queue.")
         elif mode == 'single':
-            self.loop = False
-            self.loop_single = True
+            player.loop_mode = 'single'
             await ctx.send("Looping the current song.")
         elif mode == 'off':
-            self.loop = False
-            self.loop_single = False
+            player.loop_mode = 'off'
             await ctx.send("Looping is turned off.")
         else:
             await ctx.send("Invalid mode. Use 'queue', 'single', or 'off'.")
 
-    
+    @commands.command(name='shuffle', help='Shuffles the queue')
+    async def shuffle(self, ctx):
+        player = self.players.get(ctx.guild.id)
+        if player is None or not player.queue:
+            await ctx.send("The queue is empty.")
+            return
+        player.shuffle()
+        await ctx.send("Shuffled the queue.")
+
+    @commands.command(name='remove', help='Removes a song from the queue by its position')
+    async def remove(self, ctx, position: int):
+        player = self.players.get(ctx.guild.id)
+        if player is None or not 1 <= position <= len(player.queue):
+            await ctx.send("There is no song at that position.")
+            return
+        track = player.remove(position - 1)
+        await ctx.send(f"Removed {track.title} from the queue.")
+
+    @commands.command(name='move', help='Moves a song in the queue. Usage: !move [from] [to]')
+    async def move(self, ctx, source: int, destination: int):
+        player = self.players.get(ctx.guild.id)
+        if player is None or not 1 <= source <= len(player.queue) or not 1 <= destination <= len(player.queue):
+            await ctx.send("There is no song at that position.")
+            return
+        track = player.move(source - 1, destination - 1)
+        await ctx.send(f"Moved {track.title} to position {destination}.")
+
+    @commands.command(name='history', help='Shows the recently played songs')
+    async def history(self, ctx):
+        player = self.players.get(ctx.guild.id)
+        if player is None or not player.history:
+            await ctx.send("Nothing has been played yet.")
+            return
+        recent = list(player.history)[-10:][::-1]
+        embed = discord.Embed(title="Recently Played", description="\n".join(f"{i + 1}. {track.title}" for i, track in enumerate(recent)), color=0x00ff00)
+        await ctx.send(embed=embed)
+
+
+    async def run_playlist_store(self, ctx, method, *args):
+        """Runs a blocking PlaylistStore call in the executor, reporting PlaylistErrors to the channel."""
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+        except PlaylistError as error:
+            await ctx.send(str(error))
+            raise
+
+    @commands.group(name='playlist', invoke_without_command=True, help='Manages saved playlists')
+    async def playlist(self, ctx):
+        await ctx.send('Usage: !playlist [create/add/load/list/show/delete/export/import] [name]')
+
+    @playlist.command(name='create', help='Creates an empty playlist')
+    async def playlist_create(self, ctx, *, name: str):
+        try:
+            await self.run_playlist_store(ctx, self.playlists.create, ctx.guild.id, name, ctx.author.id)
+        except PlaylistError:
+            return
+        await ctx.send(f'Created playlist {name}.')
+
+    @playlist.command(name='add', help='Adds a song (or the current song) to a playlist. Usage: !playlist add [name] [song]')
+    async def playlist_add(self, ctx, name: str, *, search: str = None):
+        if search is None:
+            player = self.players.get(ctx.guild.id)
+            track = player.current if player is not None else None
+            if track is None:
+                await ctx.send('Nothing is playing. Usage: !playlist add [name] [song]')
+                return
+        else:
+            try:
+                track = await self.search_track(search, ctx.guild.id, ctx.author.id)
+            except ExtractionError as error:
+                await ctx.send(str(error))
+                return
+            if track is None:
+                await ctx.send(f'No results found for: {search}')
+                return
+
+        try:
+            count = await self.run_playlist_store(ctx, self.playlists.add, ctx.guild.id, name, [track])
+        except PlaylistError:
+            return
+        await ctx.send(f'Added {track.title} to {name} ({count} songs).')
+
+    @playlist.command(name='load', help='Adds every song in a playlist to the queue')
+    async def playlist_load(self, ctx, *, name: str):
+        voice_client = await self.ensure_voice(ctx)
+        if voice_client is None:
+            return
+
+        try:
+            tracks = await self.run_playlist_store(ctx, self.playlists.load, ctx.guild.id, name)
+        except PlaylistError:
+            return
+        if not tracks:
+            await ctx.send(f'{name} is empty.')
+            return
+
+        # Nothing is extracted here: stream URLs are resolved a few songs ahead of playback
+        player = self.get_player(ctx.guild)
+        player.text_channel = ctx.channel
+        player.enqueue_many(self.tracks.get(track.video_id) or track for track in tracks)
+
+        if player.current is None and not voice_client.is_playing() and not voice_client.is_paused():
+            await self.play_next(ctx.guild)
+        else:
+            self.start_prefetch(player)
+        await ctx.send(f'Added {len(tracks)} songs from {name} to the queue.')
+
+    @playlist.command(name='list', help='Lists the playlists saved in this server')
+    async def playlist_list(self, ctx):
+        playlists = await self.run_playlist_store(ctx, self.playlists.list, ctx.guild.id)
+        description = "\n".join(f"{name} ({count} songs)" for name, count in playlists)
+        await ctx.send(embed=discord.Embed(title="Playlists", description=description or "No playlists yet.", color=0x00ff00))
+
+    @playlist.command(name='show', help='Shows the songs in a playlist')
+    async def playlist_show(self, ctx, *, name: str):
+        try:
+            tracks = await self.run_playlist_store(ctx, self.playlists.load, ctx.guild.id, name)
+        except PlaylistError:
+            return
+        lines = [f"{i + 1}. {track.title} ({track.duration_text})" for i, track in enumerate(tracks[:20])]
+        if len(tracks) > 20:
+            lines.append(f"...and {len(tracks) - 20} more")
+        await ctx.send(embed=discord.Embed(title=name, description="\n".join(lines) or "This playlist is empty.", color=0x00ff00))
+
+    @playlist.command(name='delete', help='Deletes a playlist')
+    async def playlist_delete(self, ctx, *, name: str):
+        try:
+            await self.run_playlist_store(ctx, self.playlists.delete, ctx.guild.id, name)
+        except PlaylistError:
+            return
+        await ctx.send(f'Deleted playlist {name}.')
+
+    @playlist.command(name='export', help='Sends a playlist as a JSON file')
+    async def playlist_export(self, ctx, *, name: str):
+        try:
+            data = await self.run_playlist_store(ctx, self.playlists.export, ctx.guild.id, name)
+        except PlaylistError:
+            return
+        file = discord.File(io.BytesIO(json.dumps(data, indent=2).encode()), filename=f"{name}.json")
+        await ctx.send(f'Here is {name}:', file=file)
+
+    @playlist.command(name='import', help='Creates a playlist from an attached JSON file')
+    async def playlist_import(self, ctx, *, name: str):
+        if not ctx.message.attachments:
+            await ctx.send('Attach a playlist JSON file to import.')
+            return
+        try:
+            data = json.loads(await ctx.message.attachments[0].read())
+        except ValueError:
+            await ctx.send("That file isn't valid JSON.")
+            return
+        try:
+            count = await self.run_playlist_store(ctx, self.playlists.import_, ctx.guild.id, name, ctx.author.id, data)
+        except PlaylistError:
+            return
+        await ctx.send(f'Imported {count} songs into {name}.')
+
 async def setup(bot):
     await bot.add_cog(Music(bot))  # Ensure this is awaited
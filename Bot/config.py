@@ -0,0 +1,70 @@
+import os
+
+# Bot-wide settings; each one can be overridden with an environment variable of the same name
+
+
+def env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def env_list(name, default=()):
+    """A comma separated list, e.g. EXTENSIONS_DISABLED=Kittens,say_command."""
+    value = os.getenv(name)
+    return tuple(item.strip() for item in value.split(",") if item.strip()) if value else tuple(default)
+
+
+# Extensions in commands/ to load, by module name; an empty EXTENSIONS_ENABLED means all of them
+EXTENSIONS_ENABLED = env_list("EXTENSIONS_ENABLED")
+EXTENSIONS_DISABLED = env_list("EXTENSIONS_DISABLED")
+EXTENSION_IMPORT_WORKERS = env_int("EXTENSION_IMPORT_WORKERS", 4)
+
+
+# Connect 4 AI: search depth limit and seconds of thinking per move for each difficulty
+CONNECT4_DIFFICULTIES = {
+    "easy": (2, env_float("CONNECT4_TIME_EASY", 0.05)),
+    "normal": (6, env_float("CONNECT4_TIME_NORMAL", 0.3)),
+    "hard": (12, env_float("CONNECT4_TIME_HARD", 1.0)),
+    "expert": (42, env_float("CONNECT4_TIME_EXPERT", 2.5)),
+}
+CONNECT4_BOOK_DIFFICULTIES = ("normal", "hard", "expert")  # Difficulties that play openings from the opening book
+CONNECT4_DEFAULT_DIFFICULTY = os.getenv("CONNECT4_DEFAULT_DIFFICULTY", "normal")
+CONNECT4_TABLE_SIZE = env_int("CONNECT4_TABLE_SIZE", 200_000)  # Positions kept in the shared transposition table
+
+# Exploding Kittens: seconds everyone gets to Nope a played card; each Nope restarts the wait
+KITTENS_NOPE_WINDOW = env_float("KITTENS_NOPE_WINDOW", 5)
+KITTENS_DM_CONCURRENCY = env_int("KITTENS_DM_CONCURRENCY", 5)  # Hand DMs sent or edited at once
+
+# Live minigames: seconds without a move before a game is abandoned, and how many games may run at once
+GAME_IDLE_TIMEOUT = env_float("GAME_IDLE_TIMEOUT", 600)
+GAME_MAX_PER_USER = env_int("GAME_MAX_PER_USER", 3)
+GAME_MAX_PER_GUILD = env_int("GAME_MAX_PER_GUILD", 50)
+CONNECT4_FLUSH_INTERVAL = env_float("CONNECT4_FLUSH_INTERVAL", 5)  # Seconds between batched writes of game state
+
+# Trivia: seconds to answer a question, and the most questions one !triviagame can ask
+TRIVIA_ANSWER_TIMEOUT = env_float("TRIVIA_ANSWER_TIMEOUT", 30)
+TRIVIA_MAX_QUESTIONS = env_int("TRIVIA_MAX_QUESTIONS", 20)
+TRIVIA_FLUSH_INTERVAL = env_float("TRIVIA_FLUSH_INTERVAL", 10)  # Seconds between batched writes of trivia scores
+
+# Music: yt-dlp worker threads, lookups allowed at once per guild, and seconds before a lookup is given up
+MUSIC_EXTRACT_WORKERS = env_int("MUSIC_EXTRACT_WORKERS", 4)
+MUSIC_EXTRACT_PER_GUILD = env_int("MUSIC_EXTRACT_PER_GUILD", 2)
+MUSIC_EXTRACT_TIMEOUT = env_float("MUSIC_EXTRACT_TIMEOUT", 20)
+MUSIC_TRACK_CACHE_SIZE = env_int("MUSIC_TRACK_CACHE_SIZE", 2000)  # Tracks whose metadata is kept between requests
+MUSIC_TRACK_CACHE_TTL = env_float("MUSIC_TRACK_CACHE_TTL", 24 * 3600)  # Seconds cached metadata is trusted
+MUSIC_STREAM_TTL = env_float("MUSIC_STREAM_TTL", 5 * 3600)  # Assumed stream URL lifetime when the URL doesn't say
+MUSIC_PLAYLIST_MAX = env_int("MUSIC_PLAYLIST_MAX", 500)  # Entries enqueued from one playlist link
+MUSIC_QUERY_MAX = env_int("MUSIC_QUERY_MAX", 25)  # Songs in one !play separated by | or new lines
+MUSIC_HISTORY_SIZE = env_int("MUSIC_HISTORY_SIZE", 50)  # Finished tracks remembered per guild
+MUSIC_PREFETCH_COUNT = env_int("MUSIC_PREFETCH_COUNT", 3)  # Upcoming tracks resolved while the current one plays
+MUSIC_WARMUP_LEAD = env_float("MUSIC_WARMUP_LEAD", 10)  # Seconds before a track ends that FFmpeg starts on the next one
+MUSIC_CACHE_MAX_MB = env_int("MUSIC_CACHE_MAX_MB", 2048)  # Disk space for cached Opus files; 0 turns the cache off
+MUSIC_CACHE_MIN_PLAYS = env_int("MUSIC_CACHE_MIN_PLAYS", 3)  # Plays before a track is downloaded into the cache
+MUSIC_IDLE_TIMEOUT = env_float("MUSIC_IDLE_TIMEOUT", 300)  # Seconds without playback before the bot leaves voice; 0 stays forever
+MUSIC_CONNECT_TIMEOUT = env_float("MUSIC_CONNECT_TIMEOUT", 15)
+MUSIC_RECONNECT_WAIT = env_float("MUSIC_RECONNECT_WAIT", 60)  # Seconds to wait for discord.py to restore a dropped voice connection
@@ -0,0 +1,57 @@
+"""Imports heavy or optional packages on first use, with a clear error when one isn't installed."""
+import importlib
+import sys
+import time
+
+import_times = {}  # module name -> seconds its first import took
+
+
+class MissingDependency(ImportError):
+    pass
+
+
+def require(module_name, package=None, purpose=None):
+    """Imports a module now, raising MissingDependency with install instructions if it isn't available."""
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+
+    start = time.perf_counter()
+    try:
+        module = importlib.import_module(module_name)
+    except ImportError as error:
+        needed_for = f" for {purpose}" if purpose else ""
+        raise MissingDependency(
+            f"'{module_name}' is needed{needed_for} but isn't installed; run: pip install {package or module_name}"
+        ) from error
+    import_times[module_name] = time.perf_counter() - start
+    return module
+
+
+class LazyModule:
+    """Stands in for a module and imports it the first time one of its attributes is used."""
+
+    def __init__(self, module_name, package=None, purpose=None):
+        self._module_name = module_name
+        self._package = package
+        self._purpose = purpose
+        self._module = None
+
+    def __getattr__(self, name):
+        if self._module is None:
+            self._module = require(self._module_name, self._package, self._purpose)
+        return getattr(self._module, name)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded yet"
+        return f"<lazy module '{self._module_name}' ({state})>"
+
+
+def lazy_import(module_name, package=None, purpose=None):
+    return LazyModule(module_name, package, purpose)
+
+
+def report():
+    """Lines describing how long each lazily imported module took, slowest first."""
+    return [f"  - {name}: {seconds * 1000:.0f} ms"
+            for name, seconds in sorted(import_times.items(), key=lambda item: item[1], reverse=True)]
@@ -0,0 +1,134 @@
+"""Bitboard game state for Connect 4, independent of Discord."""
+import random
+
+WIDTH = 7
+HEIGHT = 6
+COLUMN_BITS = HEIGHT + 1  # One spare bit on top of each column keeps the shifts below from wrapping
+
+BOTTOM_MASK = sum(1 << (col * COLUMN_BITS) for col in range(WIDTH))
+BOARD_MASK = BOTTOM_MASK * ((1 << HEIGHT) - 1)
+
+# Zobrist keys per player and bit, seeded so keys stay the same across restarts
+_zobrist_rng = random.Random(0xC4)
+ZOBRIST = [[_zobrist_rng.getrandbits(64) for _ in range(WIDTH * COLUMN_BITS)] for _ in range(2)]
+
+
+def has_four(bitboard):
+    """Checks whether a single player's bitboard contains four in a row."""
+    # Horizontal, vertical and the two diagonals, each checked with two shifts
+    for shift in (COLUMN_BITS, 1, COLUMN_BITS - 1, COLUMN_BITS + 1):
+        pairs = bitboard & (bitboard >> shift)
+        if pairs & (pairs >> (2 * shift)):
+            return True
+    return False
+
+
+class Connect4Board:
+    """A 7x6 Connect 4 board stored as one bitboard per player plus the column heights."""
+
+    __slots__ = ("boards", "heights", "moves", "key")
+
+    def __init__(self):
+        self.boards = [0, 0]  # Stones of the first and second player
+        self.heights = [col * COLUMN_BITS for col in range(WIDTH)]  # Next free bit in each column
+        self.moves = []  # Columns played so far, in order
+        self.key = 0  # Zobrist hash of the position, updated on every move
+
+    @property
+    def move_count(self):
+        return len(self.moves)
+
+    @property
+    def current_player(self):
+        """Index (0 or 1) of the player whose turn it is."""
+        return len(self.moves) & 1
+
+    @property
+    def mask(self):
+        return self.boards[0] | self.boards[1]
+
+    def copy(self):
+        board = Connect4Board.__new__(Connect4Board)
+        board.boards = self.boards[:]
+        board.heights = self.heights[:]
+        board.moves = self.moves[:]
+        board.key = self.key
+        return board
+
+    def can_play(self, col):
+        """Returns True if the column still has room for a piece."""
+        return self.heights[col] < col * COLUMN_BITS + HEIGHT
+
+    def valid_moves(self):
+        return [col for col in range(WIDTH) if self.can_play(col)]
+
+    def play(self, col):
+        """Drops a piece for the current player and returns the row it landed in (0 is the top row)."""
+        bit_index = self.heights[col]
+        player = len(self.moves) & 1
+        self.boards[player] |= 1 << bit_index
+        self.key ^= ZOBRIST[player][bit_index]
+        self.heights[col] = bit_index + 1
+        self.moves.append(col)
+        return HEIGHT - 1 - (bit_index - col * COLUMN_BITS)
+
+    def undo(self):
+        """Takes back the last move."""
+        col = self.moves.pop()
+        bit_index = self.heights[col] - 1
+        player = len(self.moves) & 1
+        self.heights[col] = bit_index
+        self.boards[player] &= ~(1 << bit_index)
+        self.key ^= ZOBRIST[player][bit_index]
+
+    def is_winning_move(self, col):
+        """Returns True if playing the column would win the game for the current player."""
+        return has_four(self.boards[len(self.moves) & 1] | (1 << self.heights[col]))
+
+    def last_move_won(self):
+        """Returns True if the player who made the last move connected four."""
+        return bool(self.moves) and has_four(self.boards[(len(self.moves) - 1) & 1])
+
+    def winning_cells(self, player):
+        """Returns a bitboard of the empty cells that would complete four in a row for the player."""
+        board = self.boards[player]
+        # Vertical
+        cells = (board << 1) & (board << 2) & (board << 3)
+        for shift in (COLUMN_BITS, COLUMN_BITS - 1, COLUMN_BITS + 1):
+            pairs = (board << shift) & (board << 2 * shift)
+            cells |= pairs & (board << 3 * shift)
+            cells |= pairs & (board >> shift)
+            pairs = (board >> shift) & (board >> 2 * shift)
+            cells |= pairs & (board << shift)
+            cells |= pairs & (board >> 3 * shift)
+        return cells & (BOARD_MASK ^ self.mask)
+
+    def pack(self):
+        """Encodes the position in a single 49-bit integer (first player's stones + occupied cells + bottom row)."""
+        return self.boards[0] + (self.boards[0] | self.boards[1]) + BOTTOM_MASK
+
+    def pack_mirrored(self):
+        """Same as pack() for the position reflected left to right."""
+        packed = self.pack()
+        mirrored = 0
+        for col in range(WIDTH):
+            column_bits = (packed >> (col * COLUMN_BITS)) & ((1 << COLUMN_BITS) - 1)
+            mirrored |= column_bits << ((WIDTH - 1 - col) * COLUMN_BITS)
+        return mirrored
+
+    def is_full(self):
+        return len(self.moves) == WIDTH * HEIGHT
+
+    def cell(self, row, col):
+        """Returns 0 or 1 for the player occupying the cell, or None if it is empty (row 0 is the top row)."""
+        bit = 1 << (col * COLUMN_BITS + HEIGHT - 1 - row)
+        if self.boards[0] & bit:
+            return 0
+        if self.boards[1] & bit:
+            return 1
+        return None
+
+    def rows(self):
+        """Yields the board top row first, each row as a list of cell owners."""
+        for row in range(HEIGHT):
+            yield [self.cell(row, col) for col in range(WIDTH)]
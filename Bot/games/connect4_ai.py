@@ -0,0 +1,183 @@
+"""Negamax search for the Connect 4 AI with a shared transposition table."""
+import threading
+import time
+from collections import OrderedDict
+
+from games.connect4 import WIDTH, HEIGHT, COLUMN_BITS
+
+import config
+
+# Columns ordered from the centre outwards, which is where the best moves usually are
+COLUMN_ORDER = sorted(range(WIDTH), key=lambda col: abs(WIDTH // 2 - col))
+CENTER_COLUMN = ((1 << HEIGHT) - 1) << (WIDTH // 2 * COLUMN_BITS)
+
+WIN_SCORE = 1000  # Any score beyond this range is a forced win or loss
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class TranspositionTable:
+    """A bounded, thread-safe cache of searched positions keyed by their Zobrist hash, evicting the least recently used."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def store(self, key, depth, flag, score, move):
+        with self.lock:
+            self.entries[key] = (depth, flag, score, move)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# Shared by every game so positions searched in one game speed up the others
+shared_table = TranspositionTable(config.CONNECT4_TABLE_SIZE)
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class Connect4AI:
+    """Iterative deepening alpha-beta search that stops when its time budget runs out."""
+
+    def __init__(self, max_depth, time_budget, table=shared_table, book=None):
+        self.max_depth = max_depth
+        self.time_budget = time_budget
+        self.table = table
+        self.book = book
+        self.deadline = 0
+        self.nodes = 0
+
+    @classmethod
+    def for_difficulty(cls, difficulty, book=None):
+        max_depth, time_budget = config.CONNECT4_DIFFICULTIES[difficulty]
+        return cls(max_depth, time_budget, book=book)
+
+    def choose_move(self, board):
+        """Returns the column to play for the side to move. Works on a copy, so it is safe to run in a thread."""
+        board = board.copy()
+        moves = board.valid_moves()
+
+        # Take a win straight away, and block the only threat if there is one
+        for col in moves:
+            if board.is_winning_move(col):
+                return col
+        threats = [col for col in moves if 1 << board.heights[col] & board.winning_cells(1 - board.current_player)]
+        if len(threats) == 1:
+            return threats[0]
+
+        # Openings are answered straight from the book when there is one
+        if self.book is not None:
+            move = self.book.lookup(board)
+            if move is not None and board.can_play(move):
+                return move
+
+        self.deadline = time.perf_counter() + self.time_budget
+        self.nodes = 0
+        best_move = next(col for col in COLUMN_ORDER if col in moves)
+        remaining = WIDTH * HEIGHT - board.move_count
+        for depth in range(1, min(self.max_depth, remaining) + 1):
+            try:
+                score, move = self.search_root(board, depth)
+            except SearchTimeout:
+                break
+            best_move = move
+            if abs(score) > WIN_SCORE:
+                break  # The result is already decided, deeper searches won't change it
+        return best_move
+
+    def search_root(self, board, depth):
+        alpha, beta = -WIN_SCORE * 2, WIN_SCORE * 2
+        best_score, best_move = -WIN_SCORE * 2, None
+        for col in self.ordered_moves(board):
+            board.play(col)
+            try:
+                score = -self.negamax(board, depth - 1, -beta, -alpha)
+            finally:
+                board.undo()
+            if score > best_score:
+                best_score, best_move = score, col
+            alpha = max(alpha, score)
+        self.table.store(board.key, depth, EXACT, best_score, best_move)
+        return best_score, best_move
+
+    def negamax(self, board, depth, alpha, beta):
+        self.nodes += 1
+        if not self.nodes & 1023 and time.perf_counter() > self.deadline:
+            raise SearchTimeout
+
+        if board.is_full():
+            return 0
+
+        moves = self.ordered_moves(board)
+        for col in moves:
+            if board.is_winning_move(col):
+                return WIN_SCORE + WIDTH * HEIGHT - board.move_count
+
+        if depth == 0:
+            return self.evaluate(board)
+
+        original_alpha = alpha
+        entry = self.table.get(board.key)
+        if entry is not None and entry[0] >= depth:
+            _, flag, score, _ = entry
+            if flag == EXACT:
+                return score
+            if flag == LOWER:
+                alpha = max(alpha, score)
+            else:
+                beta = min(beta, score)
+            if alpha >= beta:
+                return score
+
+        best_score, best_move = -WIN_SCORE * 2, moves[0]
+        for col in moves:
+            board.play(col)
+            try:
+                score = -self.negamax(board, depth - 1, -beta, -alpha)
+            finally:
+                board.undo()
+            if score > best_score:
+                best_score, best_move = score, col
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table.store(board.key, depth, flag, best_score, best_move)
+        return best_score
+
+    def ordered_moves(self, board):
+        """Playable columns, trying the table's best move first and then the centre outwards."""
+        moves = [col for col in COLUMN_ORDER if board.can_play(col)]
+        entry = self.table.get(board.key)
+        if entry is not None and entry[3] in moves:
+            moves.remove(entry[3])
+            moves.insert(0, entry[3])
+        return moves
+
+    def evaluate(self, board):
+        """Scores a quiet position for the side to move from open threats and centre control."""
+        me = board.current_player
+        mine, theirs = board.boards[me], board.boards[1 - me]
+        threat_score = bin(board.winning_cells(me)).count("1") - bin(board.winning_cells(1 - me)).count("1")
+        center_score = bin(mine & CENTER_COLUMN).count("1") - bin(theirs & CENTER_COLUMN).count("1")
+        return 4 * threat_score + center_score
@@ -0,0 +1,83 @@
+"""SQLite storage for in-progress Connect 4 games, written behind in batches."""
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+GameRecord = namedtuple("GameRecord", [
+    "game_id", "message_id", "guild_id", "channel_id", "player1_id", "player2_id", "difficulty",
+    "position", "moves", "updated_at",
+])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS connect4_games (
+    game_id TEXT PRIMARY KEY,
+    message_id INTEGER NOT NULL UNIQUE,
+    guild_id INTEGER,
+    channel_id INTEGER NOT NULL,
+    player1_id INTEGER NOT NULL,
+    player2_id INTEGER NOT NULL,  -- 0 when playing against the AI
+    difficulty TEXT NOT NULL,
+    position INTEGER NOT NULL,  -- Connect4Board.pack()
+    moves BLOB NOT NULL,  -- One byte per column played
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS connect4_games_updated_at ON connect4_games (updated_at);
+"""
+
+
+class Connect4Store:
+    """Keeps saves and deletes in memory and writes them in a single transaction when flushed."""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.db_lock = threading.Lock()
+        self.pending = {}  # game_id -> GameRecord to write, or None to delete
+        self.pending_lock = threading.Lock()
+
+    def save(self, record):
+        with self.pending_lock:
+            self.pending[record.game_id] = record
+
+    def delete(self, game_id):
+        with self.pending_lock:
+            self.pending[game_id] = None
+
+    def load_by_message(self, message_id):
+        """Returns the game shown in the message, or None. Runs a query, so call it from an executor."""
+        with self.pending_lock:
+            for game_id, record in self.pending.items():
+                if record is not None and record.message_id == message_id:
+                    return record
+            deleted = {game_id for game_id, record in self.pending.items() if record is None}
+
+        with self.db_lock:
+            row = self.db.execute("SELECT * FROM connect4_games WHERE message_id = ?", (message_id,)).fetchone()
+        if row is None or row[0] in deleted:
+            return None
+        return GameRecord(*row)
+
+    def flush(self):
+        """Writes out everything saved or deleted since the last flush. Blocking, so call it from an executor."""
+        with self.pending_lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return 0
+
+        saves = [record for record in pending.values() if record is not None]
+        deletes = [(game_id,) for game_id, record in pending.items() if record is None]
+        with self.db_lock, self.db:
+            self.db.executemany("DELETE FROM connect4_games WHERE game_id = ?", deletes)
+            self.db.executemany("INSERT OR REPLACE INTO connect4_games VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", saves)
+        return len(pending)
+
+    def prune(self, max_age):
+        """Deletes stored games that haven't been played for max_age seconds."""
+        with self.db_lock, self.db:
+            self.db.execute("DELETE FROM connect4_games WHERE updated_at < ?", (time.time() - max_age,))
+
+    def close(self):
+        self.flush()
+        with self.db_lock:
+            self.db.close()
@@ -0,0 +1,380 @@
+"""Exploding Kittens rules and game state, independent of Discord.
+
+Cards are small integers: the deck is a bytearray with its top at the end, and each hand only keeps a count
+per card type, so drawing, discarding, stealing and checking for a pair don't depend on how many cards there are.
+
+Every change to a game goes through ExplodingKittensGame.apply, which appends the action to a log of 4-byte
+records. Since all randomness comes from the game's seed, the seed, settings and log are enough to rebuild the
+game exactly (ExplodingKittensGame.replay), for spectators or after a restart.
+"""
+import random
+from enum import IntEnum
+
+
+class CardType(IntEnum):
+    EXPLODING_KITTEN = 0
+    DEFUSE = 1
+    ATTACK_X2 = 2
+    ATTACK_X3 = 3
+    SKIP = 4
+    NOPE = 5
+    SEE_THE_FUTURE = 6
+    REVEAL_THE_FUTURE = 7
+    PALINDROME_CAT = 8
+    BEARD_CAT = 9
+    SMOL_CAT = 10
+    BIG_CAT = 11
+    PANZER_CAT = 12
+
+    @property
+    def label(self):
+        return CARD_NAMES[self]
+
+    @property
+    def is_cat(self):
+        return self >= CardType.PALINDROME_CAT
+
+
+CARD_NAMES = (
+    "Exploding Kitten", "Defuse", "Attack x2", "Attack x3", "Skip", "Nope", "See the Future", "Reveal the Future",
+    "Palindrome Cat", "Beard Cat", "Smol Cat", "Big Cat", "Panzer Cat",
+)
+CAT_CARDS = tuple(card for card in CardType if card.is_cat)
+CARD_TYPES = len(CardType)
+CARD_LOOKUP = {name.lower(): CardType(card) for card, name in enumerate(CARD_NAMES)}
+
+
+def parse_card(text):
+    """The card a player typed, e.g. "attack x2" or "smol cat", or None."""
+    return CARD_LOOKUP.get(" ".join(text.lower().split()))
+
+
+class Action(IntEnum):
+    PLAY = 0  # Current player plays a card (args: card, target seat); opens a reaction window
+    NOPE = 1  # Anyone with a Nope cancels the pending card, or un-cancels it
+    RESOLVE = 2  # The reaction window closed; the pending card takes effect unless it ended up noped
+    DRAW = 3  # Current player draws to end a turn
+    DEFUSE = 4  # Current player defuses the kitten they drew, putting it back with `arg` cards above it
+
+
+class Phase(IntEnum):
+    TURN = 0  # Waiting for the current player to play a card or draw
+    REACTION = 1  # A played card is waiting out its Nope window
+    DEFUSE = 2  # The current player drew a kitten and has to say where it goes back
+    OVER = 3
+
+
+class RulesError(Exception):
+    """An action that isn't allowed right now; the game is left unchanged."""
+
+
+class Hand:
+    """A player's cards as a count per card type."""
+
+    __slots__ = ("counts", "size")
+
+    def __init__(self, cards=()):
+        self.counts = bytearray(CARD_TYPES)
+        self.size = 0
+        for card in cards:
+            self.add(card)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, card):
+        return self.counts[card] > 0
+
+    def count(self, card):
+        return self.counts[card]
+
+    def add(self, card, amount=1):
+        self.counts[card] += amount
+        self.size += amount
+
+    def remove(self, card, amount=1):
+        """Takes cards of a type out of the hand, returning False (and changing nothing) if there aren't enough."""
+        if self.counts[card] < amount:
+            return False
+        self.counts[card] -= amount
+        self.size -= amount
+        return True
+
+    def pairs(self):
+        """Cat cards the hand holds at least two of."""
+        return [card for card in CAT_CARDS if self.counts[card] >= 2]
+
+    def random_card(self, rng=random):
+        """A uniformly random card from the hand, or None if it is empty."""
+        if not self.size:
+            return None
+        pick = rng.randrange(self.size)
+        for card, count in enumerate(self.counts):
+            if pick < count:
+                return CardType(card)
+            pick -= count
+
+    def cards(self):
+        """(card type, count) for every type in the hand, in card type order."""
+        return [(CardType(card), count) for card, count in enumerate(self.counts) if count]
+
+
+def create_deck(defuse_count, attack_x2_count, attack_x3_count, skip_count, nope_count, future_count,
+                reveal_future_count, cats_each=2, rng=random):
+    """A shuffled deck without the Exploding Kittens, which are only added after dealing."""
+    counts = {
+        CardType.DEFUSE: defuse_count,
+        CardType.ATTACK_X2: attack_x2_count,
+        CardType.ATTACK_X3: attack_x3_count,
+        CardType.SKIP: skip_count,
+        CardType.NOPE: nope_count,
+        CardType.SEE_THE_FUTURE: future_count,
+        CardType.REVEAL_THE_FUTURE: reveal_future_count,
+    }
+    counts.update((cat, cats_each) for cat in CAT_CARDS)
+    deck = bytearray()
+    for card, count in counts.items():
+        deck += bytes((card,)) * count
+    rng.shuffle(deck)
+    return deck
+
+
+class ExplodingKittensGame:
+    def __init__(self, players, starting_hand_size=5, defuse_count=6, bomb_count=1, attack_x2_count=2,
+                 attack_x3_count=2, skip_count=2, nope_count=2, future_count=2, reveal_future_count=1, seed=None):
+        self.config = {
+            "starting_hand_size": starting_hand_size, "defuse_count": defuse_count, "bomb_count": bomb_count,
+            "attack_x2_count": attack_x2_count, "attack_x3_count": attack_x3_count, "skip_count": skip_count,
+            "nope_count": nope_count, "future_count": future_count, "reveal_future_count": reveal_future_count,
+        }
+        self.seed = seed if seed is not None else random.getrandbits(64)
+        self.rng = random.Random(self.seed)
+        self.seats = list(players)  # Player IDs in turn order; actions refer to players by their index here
+        self.players = list(players)  # Players still in the game, in turn order
+        self.deck = create_deck(defuse_count, attack_x2_count, attack_x3_count, skip_count, nope_count,
+                                future_count, reveal_future_count, rng=self.rng)
+        self.hands = {player: Hand() for player in players}
+        self.turn_index = 0
+        self.turns_left = 1  # Turns the current player still has to take; more than one after an Attack
+        self.phase = Phase.TURN
+        self.pending = None  # (player, card, target) waiting out its reaction window
+        self.nopes = 0  # Nopes played on the pending card; an odd number cancels it
+        self.last_peek = None  # (player, cards) from the last See the Future, only shown to that player
+        self.log = bytearray()  # 4 bytes per action: action, seat, card, argument
+        self.starting_hand_size = starting_hand_size
+        self.init_hands()
+        # Kittens go in after dealing so nobody starts with one
+        for _ in range(bomb_count):
+            self.insert_card(CardType.EXPLODING_KITTEN, self.rng.randint(0, len(self.deck)))
+
+    @classmethod
+    def replay(cls, players, config, seed, log, upto=None):
+        """Rebuilds a game from its settings, seed and action log, optionally stopping after `upto` actions."""
+        game = cls(players, seed=seed, **config)
+        end = len(log) if upto is None else min(len(log), upto * 4)
+        for offset in range(0, end, 4):
+            game.apply(*log[offset:offset + 4])
+        return game
+
+    @property
+    def current_player(self):
+        return self.players[self.turn_index]
+
+    @property
+    def is_over(self):
+        return len(self.players) <= 1
+
+    @property
+    def winner(self):
+        return self.players[0] if len(self.players) == 1 else None
+
+    def init_hands(self):
+        # Deal initial hands to each player, plus a Defuse card each
+        for player in self.players:
+            hand = self.hands[player]
+            for _ in range(min(self.starting_hand_size, len(self.deck))):
+                hand.add(self.deck.pop())
+            hand.add(CardType.DEFUSE)
+
+    def insert_card(self, card, depth):
+        """Puts a card back into the deck with `depth` cards above it (0 is the top)."""
+        # The deck's top is its end; a deck holds a few dozen bytes, so this is a single short memmove
+        self.deck.insert(len(self.deck) - depth, card)
+
+    def peek(self, count=3):
+        """The next `count` cards, top first, without drawing them."""
+        return [CardType(card) for card in reversed(self.deck[-count:])] if count else []
+
+    @staticmethod
+    def name(player_id):
+        return f"<@{player_id}>"
+
+    # Actions, by player ID; each checks the rules, applies the change and logs it
+
+    def play(self, player_id, card, target_id=None):
+        card = CardType(card)
+        if card.is_cat:
+            if target_id is None or target_id not in self.seats:
+                raise RulesError("Pick another player who is still in the game to steal from.")
+            target = self.seats.index(target_id)
+        else:
+            target = 0  # Only cat cards have a target; the byte is unused otherwise
+        return self.apply(Action.PLAY, self.seat(player_id), card, target)
+
+    def nope(self, player_id):
+        return self.apply(Action.NOPE, self.seat(player_id))
+
+    def resolve(self):
+        return self.apply(Action.RESOLVE, self.seats.index(self.pending[0]) if self.pending else 0)
+
+    def draw(self, player_id):
+        return self.apply(Action.DRAW, self.seat(player_id))
+
+    def defuse(self, player_id, depth):
+        return self.apply(Action.DEFUSE, self.seat(player_id), CardType.DEFUSE, max(0, min(depth, len(self.deck), 255)))
+
+    def seat(self, player_id):
+        if player_id not in self.seats:
+            raise RulesError("You're not in this game.")
+        return self.seats.index(player_id)
+
+    def apply(self, action, seat, card=0, arg=0):
+        """Applies one action by the player in `seat` and appends it to the log, returning what happened."""
+        if self.phase == Phase.OVER:
+            raise RulesError("The game is over.")
+        player = self.seats[seat]
+        handler = self.HANDLERS[action]
+        message = handler(self, player, CardType(card), arg)
+        self.log += bytes((action, seat, card, arg))
+        if self.is_over:
+            self.phase = Phase.OVER
+        return message
+
+    def apply_play(self, player, card, target_seat):
+        self.check_turn(player, Phase.TURN)
+        hand = self.hands[player]
+        target = self.seats[target_seat] if card.is_cat else None
+        if card.is_cat:
+            if target == player or target not in self.players:
+                raise RulesError("Pick another player who is still in the game to steal from.")
+            if hand.count(card) < 2:
+                raise RulesError(f"You need two {card.label} cards to steal.")
+            hand.remove(card, 2)
+        elif card in (CardType.EXPLODING_KITTEN, CardType.DEFUSE, CardType.NOPE):
+            raise RulesError(f"{card.label} can't be played like that.")
+        elif not hand.remove(card):
+            raise RulesError(f"You don't have a {card.label} card.")
+
+        self.pending = (player, card, target)
+        self.nopes = 0
+        self.phase = Phase.REACTION
+        against = f" against {self.name(target)}" if target is not None else ""
+        return f"{self.name(player)} played {card.label}{against}. Anyone can Nope it now!"
+
+    def apply_nope(self, player, card, arg):
+        if self.phase != Phase.REACTION:
+            raise RulesError("There's nothing to Nope right now.")
+        if player not in self.players:
+            raise RulesError("You're out of the game.")
+        if not self.hands[player].remove(CardType.NOPE):
+            raise RulesError("You don't have a Nope card.")
+        self.nopes += 1
+        played_by, played, _ = self.pending
+        state = "cancelled" if self.nopes % 2 else "back on"
+        return f"{self.name(player)} played Nope! {self.name(played_by)}'s {played.label} is {state}."
+
+    def apply_resolve(self, player, card, arg):
+        if self.phase != Phase.REACTION:
+            raise RulesError("There's no card waiting to take effect.")
+        played_by, card, target = self.pending
+        self.pending = None
+        self.phase = Phase.TURN
+        if self.nopes % 2:
+            return f"{self.name(played_by)}'s {card.label} was noped."
+
+        if card == CardType.SKIP:
+            return f"{self.name(played_by)} skipped. " + self.end_turn()
+        if card in (CardType.ATTACK_X2, CardType.ATTACK_X3):
+            # Attacks stack: a player who was attacked passes on their remaining turns as well
+            turns = (2 if card == CardType.ATTACK_X2 else 3) + (self.turns_left if self.turns_left > 1 else 0)
+            message = self.next_turn()
+            self.turns_left = turns
+            return f"{self.name(played_by)} attacked! {message} They have to take {turns} turns."
+        if card == CardType.SEE_THE_FUTURE:
+            self.last_peek = (played_by, self.peek(3))
+            return f"{self.name(played_by)} looked at the top of the deck."
+        if card == CardType.REVEAL_THE_FUTURE:
+            return f"The next cards are: {', '.join(c.label for c in self.peek(3)) or 'none'}."
+
+        # A pair of cats steals a random card
+        target_hand = self.hands[target]
+        stolen_card = target_hand.random_card(self.rng)
+        if stolen_card is None:
+            return f"{self.name(target)} had nothing to steal."
+        target_hand.remove(stolen_card)
+        self.hands[played_by].add(stolen_card)
+        return f"{self.name(played_by)} stole a card from {self.name(target)}!"
+
+    def apply_draw(self, player, card, arg):
+        self.check_turn(player, Phase.TURN)
+        if not self.deck:
+            raise RulesError("The deck is empty.")
+        card = CardType(self.deck.pop())
+        if card != CardType.EXPLODING_KITTEN:
+            self.hands[player].add(card)
+            return f"{self.name(player)} drew a card. " + self.end_turn()
+        if CardType.DEFUSE in self.hands[player]:
+            self.phase = Phase.DEFUSE
+            return f"{self.name(player)} drew an Exploding Kitten! They have to defuse it and put it back in the deck."
+        self.eliminate(player)
+        message = f"{self.name(player)} drew an Exploding Kitten and is out of the game!"
+        if not self.is_over:
+            message += f" It is now {self.name(self.current_player)}'s turn."
+        return message
+
+    def apply_defuse(self, player, card, depth):
+        self.check_turn(player, Phase.DEFUSE)
+        self.hands[player].remove(CardType.DEFUSE)
+        self.insert_card(CardType.EXPLODING_KITTEN, min(depth, len(self.deck)))
+        self.phase = Phase.TURN
+        return f"{self.name(player)} defused the kitten and hid it back in the deck. " + self.end_turn()
+
+    HANDLERS = {
+        Action.PLAY: apply_play,
+        Action.NOPE: apply_nope,
+        Action.RESOLVE: apply_resolve,
+        Action.DRAW: apply_draw,
+        Action.DEFUSE: apply_defuse,
+    }
+
+    def check_turn(self, player, phase):
+        if player not in self.players or player != self.current_player:
+            raise RulesError("It's not your turn!")
+        if self.phase != phase:
+            raise RulesError({
+                Phase.REACTION: "Wait for the played card to take effect first.",
+                Phase.DEFUSE: "You have to defuse the kitten first.",
+            }.get(self.phase, "You can't do that right now."))
+
+    def eliminate(self, player_id):
+        index = self.players.index(player_id)
+        self.players.remove(player_id)
+        if index < self.turn_index:
+            self.turn_index -= 1
+        elif index == self.turn_index:
+            # Whoever sat after them is up next, with a normal single turn
+            self.turn_index = self.turn_index % len(self.players) if self.players else 0
+            self.turns_left = 1
+
+    def end_turn(self):
+        """Finishes one of the current player's turns, passing play on once they have none left."""
+        self.turns_left -= 1
+        if self.turns_left > 0:
+            return f"{self.name(self.current_player)} has {self.turns_left} more turn(s) to take."
+        return self.next_turn()
+
+    def next_turn(self):
+        # Advance to the next player
+        self.turn_index = (self.turn_index + 1) % len(self.players)
+        self.turns_left = 1
+        return f"It is now {self.name(self.players[self.turn_index])}'s turn."
@@ -0,0 +1,261 @@
+"""Plays Exploding Kittens between bots, without Discord, to see what the deck settings do to a game.
+
+Run from the Bot directory, e.g. to compare kitten counts with four cautious players:
+
+    python -m games.kittens_sim --policies cautious,cautious,cautious,cautious --games 200000 --grid bomb_count=1,2,3
+"""
+import argparse
+import itertools
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from games.kittens import CardType, ExplodingKittensGame, Phase
+
+# The !start_game defaults
+DEFAULT_CONFIG = {
+    "starting_hand_size": 5, "defuse_count": 6, "bomb_count": 1, "attack_x2_count": 2, "attack_x3_count": 2,
+    "skip_count": 2, "nope_count": 2, "future_count": 2, "reveal_future_count": 1,
+}
+ACTION_CARDS = (CardType.ATTACK_X3, CardType.ATTACK_X2, CardType.SKIP, CardType.SEE_THE_FUTURE, CardType.REVEAL_THE_FUTURE)
+FUTURE_CARDS = (CardType.SEE_THE_FUTURE, CardType.REVEAL_THE_FUTURE)
+DODGE_CARDS = (CardType.ATTACK_X3, CardType.ATTACK_X2, CardType.SKIP)  # Cards that end a turn without drawing
+MAX_TURNS = 1000
+
+
+def random_opponent(game, player, rng):
+    return rng.choice([other for other in game.players if other != player])
+
+
+class DrawPolicy:
+    """Never plays a card; the baseline the other policies are compared with."""
+
+    def __init__(self, rng=random):
+        # Policies keep their own generator: the game's may only be used by the game, or its log wouldn't replay
+        self.rng = rng
+
+    def reset(self):
+        pass
+
+    def choose(self, game, player):
+        """The card to play next and its target, or (None, None) to draw and end the turn."""
+        return None, None
+
+    def kitten_depth(self, game, player):
+        """Where to put a defused kitten back, as cards above it."""
+        return self.rng.randint(0, len(game.deck))
+
+    def observe(self, game, player, cards):
+        """Called with the top cards after the player looks at them."""
+
+    def wants_nope(self, game, player):
+        """Whether to Nope the pending card (or the last Nope of it)."""
+        return False
+
+
+class RandomPolicy(DrawPolicy):
+    """Plays a random playable card half the time and draws otherwise."""
+
+    def choose(self, game, player):
+        hand = game.hands[player]
+        playable = [card for card, count in hand.cards() if card in ACTION_CARDS or (card.is_cat and count >= 2)]
+        if not playable or self.rng.random() < 0.5:
+            return None, None
+        card = self.rng.choice(playable)
+        return card, random_opponent(game, player, self.rng) if card.is_cat else None
+
+
+class CautiousPolicy(DrawPolicy):
+    """Looks at the top cards when it can, dodges a kitten it knows is next and puts defused kittens back on top."""
+
+    def __init__(self, rng=random):
+        super().__init__(rng)
+        self.known = {}  # player -> (deck size when they looked, top cards)
+
+    def reset(self):
+        self.known.clear()
+
+    def observe(self, game, player, cards):
+        self.known[player] = (len(game.deck), cards)
+
+    def choose(self, game, player):
+        hand = game.hands[player]
+        known = self.known.get(player)
+        if known is not None and known[0] != len(game.deck):
+            known = None  # Someone drew or put a card back since
+        if known is None:
+            for card in FUTURE_CARDS:
+                if card in hand:
+                    return card, None
+        elif known[1] and known[1][0] == CardType.EXPLODING_KITTEN:
+            for card in DODGE_CARDS:
+                if card in hand:
+                    return card, None
+
+        if CardType.DEFUSE not in hand:
+            pairs = hand.pairs()
+            if pairs:
+                return pairs[0], random_opponent(game, player, self.rng)  # Fishing for someone else's Defuse
+        return None, None
+
+    def kitten_depth(self, game, player):
+        return 0
+
+    def wants_nope(self, game, player):
+        # Stop attacks and steals aimed at itself, and Nope back when its own card gets noped
+        played_by, card, target = game.pending
+        if played_by == player:
+            return game.nopes % 2 == 1
+        if game.nopes % 2:
+            return False
+        victim = target if card.is_cat else game.players[(game.turn_index + 1) % len(game.players)]
+        return victim == player and (card.is_cat or card in (CardType.ATTACK_X2, CardType.ATTACK_X3))
+
+
+POLICIES = {"draw": DrawPolicy, "random": RandomPolicy, "cautious": CautiousPolicy}
+
+
+def play_game(config, policies, seed):
+    """Plays one game and returns (winning seat or None if it stalled, turns taken, defuses used)."""
+    game = ExplodingKittensGame(list(range(len(policies))), seed=seed, **config)
+    turns = defuses = 0
+    while not game.is_over:
+        if not game.deck or turns >= MAX_TURNS:
+            return None, turns, defuses  # Fewer kittens than eliminations needed, so nobody can win
+        player = game.current_player
+        policy = policies[player]
+
+        card, target = policy.choose(game, player)
+        if card is not None:
+            game.play(player, card, target)
+            react(game, policies)
+            game.resolve()
+            if card in FUTURE_CARDS:
+                policy.observe(game, player, game.peek(3))
+            elif card in DODGE_CARDS:
+                turns += 1
+            continue
+
+        turns += 1
+        game.draw(player)
+        if game.phase == Phase.DEFUSE:
+            game.defuse(player, policy.kitten_depth(game, player))
+            defuses += 1
+    return game.winner, turns, defuses
+
+
+def react(game, policies):
+    """Gives every other player a chance to Nope, going round until nobody wants to."""
+    last = game.pending[0]
+    noped = True
+    while noped:
+        noped = False
+        for player in game.players:
+            if player != last and CardType.NOPE in game.hands[player] and policies[player].wants_nope(game, player):
+                game.nope(player)
+                last, noped = player, True
+                break
+
+
+def new_stats(seats):
+    return {"games": 0, "stalled": 0, "wins": [0] * seats, "turns": 0, "turns_squared": 0, "max_turns": 0, "defuses": 0}
+
+
+def merge_stats(total, stats):
+    for key in ("games", "stalled", "turns", "turns_squared", "defuses"):
+        total[key] += stats[key]
+    total["max_turns"] = max(total["max_turns"], stats["max_turns"])
+    total["wins"] = [a + b for a, b in zip(total["wins"], stats["wins"])]
+
+
+def simulate(job):
+    """Plays a batch of games for one configuration; runs in a worker process."""
+    config, policy_names, games, seed = job
+    rng = random.Random(seed)  # Seeds each game, so one batch seed reproduces every game in it
+    policies = [POLICIES[name](rng) for name in policy_names]
+    stats = new_stats(len(policies))
+    for _ in range(games):
+        for policy in policies:
+            policy.reset()
+        winner, turns, defuses = play_game(config, policies, rng.getrandbits(64))
+        stats["games"] += 1
+        if winner is None:
+            stats["stalled"] += 1
+        else:
+            stats["wins"][winner] += 1
+        stats["turns"] += turns
+        stats["turns_squared"] += turns * turns
+        stats["max_turns"] = max(stats["max_turns"], turns)
+        stats["defuses"] += defuses
+    return stats
+
+
+def run_sweep(configs, policy_names, games, workers, seed=0, chunk_size=5000):
+    """Plays `games` games per configuration across a process pool and returns the stats for each one.
+
+    Every chunk has its own seed derived from `seed`, so a sweep gives the same numbers however many workers run it.
+    """
+    jobs, owners = [], []
+    for index, config in enumerate(configs):
+        for start in range(0, games, chunk_size):
+            jobs.append((config, policy_names, min(chunk_size, games - start), f"{seed}:{index}:{start}"))
+            owners.append(index)
+
+    results = [new_stats(len(policy_names)) for _ in configs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for index, stats in zip(owners, pool.map(simulate, jobs)):
+            merge_stats(results[index], stats)
+    return results
+
+
+def parse_grid(items):
+    """Turns ["bomb_count=1,2", "defuse_count=4,6"] into every combination of those settings over the defaults."""
+    axes = []
+    for item in items:
+        name, _, values = item.partition("=")
+        if name not in DEFAULT_CONFIG:
+            raise SystemExit(f"Unknown setting '{name}'; choose from {', '.join(DEFAULT_CONFIG)}")
+        axes.append([(name, int(value)) for value in values.split(",")])
+    return [dict(DEFAULT_CONFIG, **dict(combination)) for combination in itertools.product(*axes)]
+
+
+def describe(config):
+    changed = [f"{name}={value}" for name, value in config.items() if DEFAULT_CONFIG[name] != value]
+    return " ".join(changed) or "defaults"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate Exploding Kittens games to compare deck settings.")
+    parser.add_argument("--policies", default="cautious,cautious,cautious,cautious",
+                        help=f"One policy per seat, comma separated: {', '.join(POLICIES)}")
+    parser.add_argument("--games", type=int, default=100_000, help="Games per configuration")
+    parser.add_argument("--grid", nargs="*", default=[], help="Settings to sweep, e.g. bomb_count=1,2,3")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    policy_names = args.policies.split(",")
+    if len(policy_names) < 2 or any(name not in POLICIES for name in policy_names):
+        raise SystemExit(f"Give at least two policies from: {', '.join(POLICIES)}")
+    configs = parse_grid(args.grid)
+
+    started = time.perf_counter()
+    results = run_sweep(configs, policy_names, args.games, args.workers, args.seed)
+    elapsed = time.perf_counter() - started
+
+    for config, stats in zip(configs, results):
+        games = stats["games"]
+        mean = stats["turns"] / games
+        spread = math.sqrt(max(0.0, stats["turns_squared"] / games - mean * mean))
+        seats = " ".join(f"{wins / games:6.1%}" for wins in stats["wins"])
+        print(f"{describe(config)}: turns {mean:.1f} ± {spread:.1f} (max {stats['max_turns']}), "
+              f"defuses {stats['defuses'] / games:.2f}, stalled {stats['stalled'] / games:.1%}, wins by seat {seats}")
+    total = games * len(configs)
+    print(f"Played {total} games in {elapsed:.1f}s ({total / elapsed:.0f} games/s)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
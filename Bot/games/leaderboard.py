@@ -0,0 +1,113 @@
+"""Per-guild trivia scores and streaks, ranked in memory and written to SQLite in batches."""
+import bisect
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trivia_scores (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    streak INTEGER NOT NULL,
+    best_streak INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, user_id)
+);
+"""
+
+
+class GuildRanking:
+    """Scores for one guild, kept in a list sorted by (-score, user_id) so ranks are found with bisect."""
+
+    def __init__(self):
+        self.entries = {}  # user_id -> [score, streak, best_streak]
+        self.order = []  # (-score, user_id), ascending
+
+    def record(self, user_id, correct):
+        """Updates a player's score and streak after an answer and returns their entry."""
+        entry = self.entries.get(user_id)
+        if entry is None:
+            entry = self.entries[user_id] = [0, 0, 0]
+            bisect.insort(self.order, (0, user_id))
+
+        if not correct:
+            entry[1] = 0
+            return entry
+
+        old_key = (-entry[0], user_id)
+        del self.order[bisect.bisect_left(self.order, old_key)]
+        entry[0] += 1
+        entry[1] += 1
+        entry[2] = max(entry[2], entry[1])
+        bisect.insort(self.order, (-entry[0], user_id))
+        return entry
+
+    def rank(self, user_id):
+        """1-based rank of the player, or None if they haven't answered yet."""
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        # Players with the same score share the rank of the first of them
+        return bisect.bisect_left(self.order, (-entry[0],)) + 1
+
+    def top(self, count):
+        """The best players as (user_id, score, streak, best_streak), highest score first."""
+        return [(user_id, *self.entries[user_id]) for _, user_id in self.order[:count]]
+
+    def __len__(self):
+        return len(self.order)
+
+
+class Leaderboard:
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.db_lock = threading.Lock()
+        self.guilds = {}  # guild_id -> GuildRanking, loaded on first use
+        self.dirty = {}  # (guild_id, user_id) -> row waiting to be written
+        self.dirty_lock = threading.Lock()
+
+    def load_guild(self, guild_id):
+        """Reads a guild's scores from disk. Blocking, so call it from an executor before the first use."""
+        with self.db_lock:
+            rows = self.db.execute(
+                "SELECT user_id, score, streak, best_streak FROM trivia_scores WHERE guild_id = ?", (guild_id,)
+            ).fetchall()
+        ranking = GuildRanking()
+        for row in rows:
+            ranking.entries[row[0]] = list(row[1:])
+        ranking.order = sorted((-row[1], row[0]) for row in rows)
+        return ranking
+
+    def is_loaded(self, guild_id):
+        return guild_id in self.guilds
+
+    def set_guild(self, guild_id, ranking):
+        self.guilds.setdefault(guild_id, ranking)
+
+    def record(self, guild_id, user_id, correct):
+        """Counts an answer in memory; it reaches the disk on the next flush."""
+        entry = self.guilds[guild_id].record(user_id, correct)
+        with self.dirty_lock:
+            self.dirty[(guild_id, user_id)] = (guild_id, user_id, *entry)
+        return entry
+
+    def rank(self, guild_id, user_id):
+        return self.guilds[guild_id].rank(user_id)
+
+    def top(self, guild_id, count=10):
+        return self.guilds[guild_id].top(count)
+
+    def flush(self):
+        """Writes every changed score in one transaction. Blocking, so call it from an executor."""
+        with self.dirty_lock:
+            rows, self.dirty = list(self.dirty.values()), {}
+        if not rows:
+            return 0
+        with self.db_lock, self.db:
+            self.db.executemany("INSERT OR REPLACE INTO trivia_scores VALUES (?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def close(self):
+        self.flush()
+        with self.db_lock:
+            self.db.close()
@@ -0,0 +1,147 @@
+"""Precomputed best moves for early Connect 4 positions.
+
+The book is a flat binary file: a header, a sorted array of packed positions and one byte per
+position holding the best column. It is memory-mapped and searched with bisect, so a lookup never
+parses or copies the file.
+
+Build it offline from the Bot directory with:
+    python -m games.opening_book --plies 8 --time 0.1 --workers 4
+"""
+import argparse
+import bisect
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import setup
+from games.connect4 import Connect4Board, WIDTH
+from games.connect4_ai import Connect4AI, TranspositionTable
+
+BOOK_PATH = os.path.join(setup.directories['minigames'], 'connect4_book.bin')
+
+MAGIC = b"C4OB"
+VERSION = 1
+HEADER = struct.Struct("<4sBBxxI")  # Magic, version, max plies, padding, entry count
+
+
+class OpeningBook:
+    """Read-only view over a memory-mapped opening book file."""
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.max_plies, count = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} Connect 4 opening book")
+
+        keys_end = HEADER.size + count * 8
+        self.keys = memoryview(self.data)[HEADER.size:keys_end].cast("Q")
+        self.moves = memoryview(self.data)[keys_end:keys_end + count]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, board):
+        """Returns the book move for the position, or None if it isn't in the book."""
+        if board.move_count > self.max_plies:
+            return None
+
+        # Positions are stored once per mirror pair, under the smaller of the two keys
+        packed, mirrored = board.pack(), board.pack_mirrored()
+        key = min(packed, mirrored)
+        index = bisect.bisect_left(self.keys, key)
+        if index == len(self.keys) or self.keys[index] != key:
+            return None
+
+        move = self.moves[index]
+        return move if key == packed else WIDTH - 1 - move
+
+
+_book = None
+_book_loaded = False
+
+
+def get_book():
+    """Opens the book the first time it is needed; returns None if it hasn't been built."""
+    global _book, _book_loaded
+    if not _book_loaded:
+        _book_loaded = True
+        if os.path.exists(BOOK_PATH):
+            _book = OpeningBook(BOOK_PATH)
+            print(f"Loaded Connect 4 opening book with {len(_book)} positions")
+    return _book
+
+
+def collect_positions(max_plies):
+    """Returns every non-terminal position up to max_plies as a dict of canonical key -> move list."""
+    positions = {}
+    board = Connect4Board()
+
+    def visit():
+        packed, mirrored = board.pack(), board.pack_mirrored()
+        key = min(packed, mirrored)
+        if key in positions:
+            return
+        positions[key] = board.moves[:] if key == packed else [WIDTH - 1 - col for col in board.moves]
+        if board.move_count == max_plies:
+            return
+        for col in board.valid_moves():
+            if board.is_winning_move(col):
+                continue  # Games end here, so there is nothing to look up afterwards
+            board.play(col)
+            visit()
+            board.undo()
+
+    visit()
+    return positions
+
+
+def solve_position(args):
+    """Worker: replays the moves and searches the resulting position."""
+    moves, max_depth, time_budget = args
+    board = Connect4Board()
+    for col in moves:
+        board.play(col)
+    ai = Connect4AI(max_depth, time_budget, table=_worker_table)
+    return ai.choose_move(board)
+
+
+_worker_table = TranspositionTable(1_000_000)
+
+
+def build_book(path, max_plies, max_depth, time_budget, workers):
+    positions = collect_positions(max_plies)
+    keys = sorted(positions)
+    print(f"Solving {len(keys)} positions up to ply {max_plies}...")
+
+    started = time.perf_counter()
+    jobs = ((positions[key], max_depth, time_budget) for key in keys)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        moves = bytes(pool.map(solve_position, jobs, chunksize=64))
+
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, max_plies, len(keys)))
+        file.write(array("Q", keys).tobytes())
+        file.write(moves)
+    print(f"Wrote {path} in {time.perf_counter() - started:.1f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the Connect 4 opening book.")
+    parser.add_argument("--plies", type=int, default=8, help="Deepest position to include")
+    parser.add_argument("--depth", type=int, default=42, help="Search depth limit per position")
+    parser.add_argument("--time", type=float, default=0.1, help="Seconds of search per position")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--output", default=BOOK_PATH)
+    args = parser.parse_args(argv)
+
+    setup.check_dependencies()
+    build_book(args.output, args.plies, args.depth, args.time, args.workers)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Bookkeeping for live games: lookups, idle timeouts, per-user and per-guild caps."""
+import sys
+import time
+from collections import defaultdict
+
+
+def approximate_size(obj, depth=2):
+    """Rough memory footprint of an object and the containers it holds, in bytes."""
+    size = sys.getsizeof(obj)
+    if depth == 0:
+        return size
+    if isinstance(obj, dict):
+        return size + sum(approximate_size(value, depth - 1) for value in obj.values())
+    if isinstance(obj, (list, tuple, set)):
+        return size + sum(approximate_size(item, depth - 1) for item in obj)
+    attributes = getattr(obj, "__dict__", None)
+    if attributes is not None:
+        return size + approximate_size(attributes, depth - 1)
+    slots = getattr(type(obj), "__slots__", ())
+    return size + sum(approximate_size(getattr(obj, name), depth - 1) for name in slots if hasattr(obj, name))
+
+
+class GameRegistry:
+    def __init__(self, idle_timeout, max_per_user, max_per_guild):
+        self.idle_timeout = idle_timeout
+        self.max_per_user = max_per_user
+        self.max_per_guild = max_per_guild
+        self.games = {}  # game_id -> game
+        self.last_active = {}  # game_id -> time.monotonic() of the last move
+        self.owners = {}  # game_id -> (user ids, guild id)
+        self.messages = {}  # message id -> game_id, for games driven by buttons on a message
+        self.message_of = {}  # game_id -> message id
+        self.by_user = defaultdict(set)
+        self.by_guild = defaultdict(set)
+
+    def __len__(self):
+        return len(self.games)
+
+    def __contains__(self, game_id):
+        return game_id in self.games
+
+    def check_limits(self, game_id, user_ids, guild_id):
+        """Returns a message explaining why the game can't start, or None if it can."""
+        if game_id in self.games:
+            return "You already have a game in progress with that opponent."
+        for user_id in user_ids:
+            if len(self.by_user[user_id]) >= self.max_per_user:
+                return f"<@{user_id}> already has {self.max_per_user} games in progress."
+        if len(self.by_guild[guild_id]) >= self.max_per_guild:
+            return "Too many games are running in this server right now, try again later."
+        return None
+
+    def add(self, game_id, game, user_ids, guild_id):
+        self.games[game_id] = game
+        self.last_active[game_id] = time.monotonic()
+        self.owners[game_id] = (tuple(user_ids), guild_id)
+        for user_id in user_ids:
+            self.by_user[user_id].add(game_id)
+        self.by_guild[guild_id].add(game_id)
+
+    def get(self, game_id):
+        return self.games.get(game_id)
+
+    def bind_message(self, game_id, message_id):
+        self.messages[message_id] = game_id
+        self.message_of[game_id] = message_id
+
+    def get_by_message(self, message_id):
+        game_id = self.messages.get(message_id)
+        return self.games.get(game_id) if game_id is not None else None
+
+    def touch(self, game_id):
+        """Marks the game as active so it isn't evicted for idling."""
+        if game_id in self.last_active:
+            self.last_active[game_id] = time.monotonic()
+
+    def remove(self, game_id):
+        """Forgets a finished or abandoned game and returns it (None if it wasn't registered)."""
+        game = self.games.pop(game_id, None)
+        if game is None:
+            return None
+        del self.last_active[game_id]
+        user_ids, guild_id = self.owners.pop(game_id)
+        message_id = self.message_of.pop(game_id, None)
+        if message_id is not None:
+            del self.messages[message_id]
+        for user_id in user_ids:
+            self.discard_index(self.by_user, user_id, game_id)
+        self.discard_index(self.by_guild, guild_id, game_id)
+        return game
+
+    @staticmethod
+    def discard_index(index, key, game_id):
+        games = index[key]
+        games.discard(game_id)
+        if not games:
+            del index[key]
+
+    def pop_idle(self):
+        """Removes and returns every game that hasn't seen a move within the idle timeout."""
+        cutoff = time.monotonic() - self.idle_timeout
+        idle = [game_id for game_id, last_active in self.last_active.items() if last_active < cutoff]
+        return [self.remove(game_id) for game_id in idle]
+
+    def stats(self, guild_id=None):
+        """Live game counts and an estimate of the memory they hold."""
+        return {
+            "live_games": len(self.games),
+            "guild_games": len(self.by_guild.get(guild_id, ())),
+            "players": len(self.by_user),
+            "memory_bytes": sum(approximate_size(game) for game in self.games.values()),
+        }
@@ -0,0 +1,50 @@
+"""Routes game button presses to the right game from the button's custom_id alone.
+
+Game buttons use custom_ids of the form "<game type>:<game id>:<action>". Messages are sent with views that are
+already stopped, so discord.py keeps no View per message; one on_interaction listener parses the custom_id and
+calls the handler registered for the game type, which looks the game up by id. Buttons therefore keep working
+for as long as the game exists, across view timeouts and restarts.
+"""
+
+
+def make_custom_id(game_type, game_id, action):
+    return f"{game_type}:{game_id}:{action}"
+
+
+def parse_custom_id(custom_id):
+    """(game type, game id, action), or None if the custom_id isn't one of ours."""
+    parts = custom_id.split(":", 2)
+    return tuple(parts) if len(parts) == 3 else None
+
+
+class InteractionRouter:
+    def __init__(self):
+        self.handlers = {}  # game type -> async handler(interaction, game_id, action)
+        self.attached = set()  # ids of the bots whose listener is installed
+
+    def attach(self, bot):
+        """Installs the single on_interaction listener; safe to call from every cog that registers handlers."""
+        if id(bot) not in self.attached:
+            bot.add_listener(self.on_interaction, "on_interaction")
+            self.attached.add(id(bot))
+
+    def register(self, game_type, handler):
+        self.handlers[game_type] = handler
+
+    def unregister(self, game_type):
+        self.handlers.pop(game_type, None)
+
+    async def on_interaction(self, interaction):
+        data = interaction.data or {}
+        custom_id = data.get("custom_id")
+        if not custom_id:
+            return
+        parsed = parse_custom_id(custom_id)
+        if parsed is None:
+            return
+        handler = self.handlers.get(parsed[0])
+        if handler is not None:
+            await handler(interaction, parsed[1], parsed[2])
+
+
+router = InteractionRouter()  # Shared by every cog with game buttons
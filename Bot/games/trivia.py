@@ -0,0 +1,204 @@
+"""Trivia question packs compiled into an in-memory index.
+
+Every .json file in the trivia directory is a pack, in one of two shapes:
+    {"Zealot": {"health": 100, "shield": 50}, ...}    one question per subject and attribute
+    {"questions": [{"question": "...", "answer": ..., "category": "...", "difficulty": "..."}, ...]}
+
+Packs are compiled by TriviaBank.refresh, which reads and parses files and so belongs in an executor; it only
+recompiles packs whose file changed. draw() and topics() just read the compiled index.
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+Question = namedtuple("Question", ["text", "answer", "category", "attribute", "difficulty", "expected"])
+
+NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+NON_WORD = re.compile(r"[^\w\s]")
+
+DEFAULT_DIFFICULTY = "normal"
+
+
+def normalize_text(text):
+    return " ".join(NON_WORD.sub(" ", str(text).lower()).split())
+
+
+def expected_answer(answer):
+    """Precomputes what a response is compared against: the leading number for numeric answers, else normalized text."""
+    if isinstance(answer, (int, float)) and not isinstance(answer, bool):
+        return float(answer)
+    match = NUMBER.match(str(answer).strip())
+    if match:
+        return float(match.group())  # Answers like "1 (+1)" are judged on their base value
+    return normalize_text(answer)
+
+
+def is_correct(question, response):
+    """Checks a chat message against a question.
+
+    A numeric answer needs a message with exactly one number, and a text answer needs the whole message to match,
+    so posting a list of guesses never wins.
+    """
+    expected = question.expected
+    if isinstance(expected, float):
+        numbers = NUMBER.findall(response.replace(",", ""))
+        return len(numbers) == 1 and float(numbers[0]) == expected
+    return normalize_text(response) == expected
+
+
+def compile_pack(name, data):
+    """Turns a parsed pack file into a list of Questions."""
+    if isinstance(data, dict) and isinstance(data.get("questions"), list):
+        return [
+            Question(
+                entry["question"], entry["answer"], entry.get("category", name), entry.get("attribute"),
+                entry.get("difficulty", DEFAULT_DIFFICULTY), expected_answer(entry["answer"]),
+            )
+            for entry in data["questions"]
+            if entry["answer"] is not None
+        ]
+
+    questions = []
+    for subject, attributes in data.items():
+        for attribute, answer in attributes.items():
+            if answer is None:
+                continue  # The unit doesn't have this attribute, so there's nothing to ask
+            text = f"What is the {attribute.replace('_', ' ')} of {subject}?"
+            questions.append(Question(text, answer, name, attribute, DEFAULT_DIFFICULTY, expected_answer(answer)))
+    return questions
+
+
+class TriviaBank:
+    def __init__(self, directory, reload_interval=30):
+        self.directory = directory
+        self.reload_interval = reload_interval  # Seconds between checks for changed pack files
+        self.packs = {}  # path -> (mtime, questions)
+        self.questions = []
+        self.index = {}  # (field, value) -> list of positions in self.questions
+        self.last_checked = None
+        self.refresh_lock = threading.Lock()  # One refresh at a time, since they run in executor threads
+        self.swap_lock = threading.Lock()  # Keeps readers from seeing new questions with the old index
+
+    def refresh(self, force=False):
+        """Recompiles packs whose files were added, changed or removed since the last check; blocks on file I/O."""
+        with self.refresh_lock:
+            self.refresh_packs(force)
+
+    def refresh_packs(self, force):
+        now = time.monotonic()
+        if not force and self.last_checked is not None and now - self.last_checked < self.reload_interval:
+            return
+        self.last_checked = now
+
+        current = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(".json"):
+                    current[entry.path] = entry.stat().st_mtime
+        if current.keys() == self.packs.keys() and all(self.packs[path][0] == mtime for path, mtime in current.items()):
+            return
+
+        packs = {}
+        for path, mtime in current.items():
+            cached = self.packs.get(path)
+            if cached is not None and cached[0] == mtime:
+                packs[path] = cached
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as file:
+                    data = json.load(file)
+                name = os.path.splitext(os.path.basename(path))[0]
+                packs[path] = (mtime, compile_pack(name, data))
+            except (OSError, ValueError, KeyError, AttributeError) as error:
+                print(f"Skipping trivia pack {path}: {error}")
+        questions, index = self.build_index(packs)
+        with self.swap_lock:
+            self.packs, self.questions, self.index = packs, questions, index
+
+    @staticmethod
+    def build_index(packs):
+        questions = [question for _, pack in packs.values() for question in pack]
+        index = defaultdict(list)
+        for position, question in enumerate(questions):
+            index[("category", question.category.lower())].append(position)
+            index[("difficulty", question.difficulty.lower())].append(position)
+            if question.attribute:
+                index[("attribute", question.attribute.lower())].append(position)
+        return questions, dict(index)
+
+    def topics(self):
+        """Names that can be passed to draw(), grouped by field."""
+        with self.swap_lock:
+            index = self.index
+        topics = defaultdict(list)
+        for field, value in index:
+            topics[field].append(value)
+        return topics
+
+    def draw(self, topic=None):
+        """Returns a random question, optionally limited to a category, attribute or difficulty; None if none match."""
+        with self.swap_lock:
+            questions, index = self.questions, self.index
+        if topic is None:
+            return random.choice(questions) if questions else None
+
+        topic = topic.lower()
+        for field in ("category", "attribute", "difficulty"):
+            positions = index.get((field, topic))
+            if positions:
+                return questions[random.choice(positions)]
+        return None
+
+
+class OpenQuestion:
+    __slots__ = ("question", "future", "players", "single_guess")
+
+    def __init__(self, question, future, players, single_guess):
+        self.question = question
+        self.future = future  # Resolves to (user id, correct)
+        self.players = players  # User ids allowed to answer, or None for anyone
+        self.single_guess = single_guess  # End on the first answer instead of waiting for a correct one
+
+
+class TriviaRounds:
+    """Open questions keyed by channel, so each chat message is checked against at most one question."""
+
+    def __init__(self):
+        self.open = {}  # channel id -> OpenQuestion
+
+    def is_open(self, channel_id):
+        open_question = self.open.get(channel_id)
+        return open_question is not None and not open_question.future.done()
+
+    def ask(self, channel_id, question, players=None, single_guess=False):
+        """Opens a question in the channel and returns a future for its answer; None if one is already open."""
+        open_question = self.open.get(channel_id)
+        if open_question is not None and not open_question.future.done():
+            return None
+        future = asyncio.get_running_loop().create_future()
+        self.open[channel_id] = OpenQuestion(question, future, players, single_guess)
+        future.add_done_callback(lambda _: self.close(channel_id, future))
+        return future
+
+    def close(self, channel_id, future):
+        open_question = self.open.get(channel_id)
+        if open_question is not None and open_question.future is future:
+            del self.open[channel_id]
+
+    def dispatch(self, channel_id, user_id, content):
+        """Checks a chat message against the channel's open question, if there is one."""
+        open_question = self.open.get(channel_id)
+        if open_question is None or open_question.future.done():
+            return
+        if open_question.players is not None and user_id not in open_question.players:
+            return
+
+        correct = is_correct(open_question.question, content)
+        if correct or open_question.single_guess:
+            del self.open[channel_id]
+            open_question.future.set_result((user_id, correct))
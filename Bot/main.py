@@ -1,7 +1,15 @@
 import discord
 from discord.ext import commands
 import os
+import time
 import asyncio
+import ast
+import importlib
+import importlib.util
+import pkgutil
+from concurrent.futures import ThreadPoolExecutor
+import config
+import deps
 import setup  # Import setup.py to run the directory checks
 
 # Print current working directory
@@ -20,17 +28,77 @@ async def list_command_groups():
         for command in cog.get_commands():
             print(f'  - {command.name}: {command.help}')
 
+COMMANDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'commands')
+extension_stats = {}  # extension name -> (seconds to load, error message or None)
+
+# Finds the cogs next to this file rather than in the working directory, honouring the enable/disable lists
+def discover_extensions():
+    names = []
+    for module in pkgutil.iter_modules([COMMANDS_PATH]):
+        if module.ispkg:
+            continue
+        if config.EXTENSIONS_ENABLED and module.name not in config.EXTENSIONS_ENABLED:
+            continue
+        if module.name in config.EXTENSIONS_DISABLED:
+            continue
+        names.append(f'commands.{module.name}')
+    return sorted(names)
+
+# Imports the modules a cog imports at its top level, without running the cog itself
+def import_dependencies(name):
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.origin is None:
+        return
+    with open(spec.origin, 'r', encoding='utf-8') as file:
+        tree = ast.parse(file.read(), spec.origin)
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            modules = [node.module]
+        else:
+            continue
+        for module in modules:
+            try:
+                importlib.import_module(module)
+            except Exception:
+                pass  # load_extension hits the same error and reports it against the cog
+
+async def load_extension(name, executor):
+    start = time.perf_counter()
+    try:
+        # Importing the cog's dependencies in a worker thread first keeps the slow imports off the event loop,
+        # so load_extension only has to run the cog's own module (once) and setup()
+        await asyncio.get_running_loop().run_in_executor(executor, import_dependencies, name)
+        await bot.load_extension(name)
+    except Exception as error:
+        # A broken cog or a missing optional dependency shouldn't stop the others from loading
+        cause = error.__cause__ if isinstance(error, commands.ExtensionError) and error.__cause__ else error
+        extension_stats[name] = (time.perf_counter() - start, f'{type(cause).__name__}: {cause}')
+    else:
+        extension_stats[name] = (time.perf_counter() - start, None)
+
 # Function to load commands from the 'commands' directory
 async def load_extensions():
-    for filename in os.listdir('./commands'):
-        if filename.endswith('.py') and filename != '__init__.py':
-            await bot.load_extension(f'commands.{filename[:-3]}')
+    names = discover_extensions()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=config.EXTENSION_IMPORT_WORKERS, thread_name_prefix='extension-import') as executor:
+        await asyncio.gather(*(load_extension(name, executor) for name in names))
+    print(f'Loaded {len(names)} extensions in {(time.perf_counter() - start) * 1000:.0f} ms:')
+    for name, (seconds, error) in sorted(extension_stats.items(), key=lambda item: item[1][0], reverse=True):
+        if error is None:
+            print(f'  - {name}: {seconds * 1000:.0f} ms')
+        else:
+            print(f'  - {name}: FAILED after {seconds * 1000:.0f} ms ({error})')
 
 # Bot event to notify that it's ready and display command groups
 @bot.event
 async def on_ready():
     print(f'Logged in as {bot.user.name}')
     await list_command_groups()
+    if deps.import_times:
+        print('Lazily imported modules:')
+        print('\n'.join(deps.report()))
 
 # Replace 'YOUR_DISCORD_TOKEN' with your actual token
 async def main():
@@ -4,7 +4,8 @@ import os
 directories = {
     'playlists': './data/playlists',
     'trivia': './data/trivia',
-    'minigames': './data/minigames'
+    'minigames': './data/minigames',
+    'audio_cache': './data/audio_cache'
 }
 
 def check_dependencies():